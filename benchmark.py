@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import argparse
+import subprocess
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+from PIL import Image
+
+# Same input and output shapes as the wd v1.4 taggers
+MODEL_INPUT_SIZE = 448
+NUM_LABELS = 9083
+NUM_RATINGS = 4
+NUM_CHARACTERS = 2000
+
+# (format, extension, modes) mix of the synthetic corpus
+CORPUS_FORMATS = [
+    ("JPEG", ".jpg", ["RGB", "RGB", "L", "CMYK"]),
+    ("JPEG", ".jpeg", ["RGB"]),
+    ("PNG", ".png", ["RGB", "RGBA", "P", "L"]),
+    ("BMP", ".bmp", ["RGB"]),
+    ("GIF", ".gif", ["P"]),
+]
+CORPUS_SIZES = [(320, 240), (640, 480), (800, 1200), (1024, 1024), (1920, 1080), (2400, 3600)]
+
+def make_corpus(directory, count=200, seed=0):
+    """
+    Write a reproducible set of `count` synthetic images in mixed sizes, formats and
+    modes. Images are gradients plus noise, so they compress like real pictures
+    rather than like flat color or pure noise.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        image_format, ext, modes = CORPUS_FORMATS[i % len(CORPUS_FORMATS)]
+        mode = modes[rng.integers(len(modes))]
+        width, height = CORPUS_SIZES[rng.integers(len(CORPUS_SIZES))]
+        y, x = np.mgrid[0:height, 0:width]
+        base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+        noise = rng.integers(-24, 24, size=(height // 8 + 1, width // 8 + 1, 3)).repeat(8, 0).repeat(8, 1)
+        pixels = np.clip(base + noise[:height, :width], 0, 255).astype(np.uint8)
+        image = Image.fromarray(pixels).convert(mode)
+        image.save(os.path.join(directory, f"img{i:05d}{ext}"), format=image_format)
+
+def make_tiny_tagger(model_dir, num_labels=NUM_LABELS, seed=0):
+    """
+    Write a stand-in for the wd tagger (model.onnx and selected_tags.csv) to
+    model_dir. It takes the same [N, 448, 448, 3] float input and returns
+    [N, num_labels] sigmoid scores, from an average pool and one small matmul, so
+    it runs on any CPU in milliseconds and tags differ from image to image.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    pool = 32
+    features = (MODEL_INPUT_SIZE // pool) ** 2 * 3
+    weights = rng.standard_normal((features, num_labels)).astype(np.float32) * 0.05
+    bias = rng.standard_normal(num_labels).astype(np.float32) - 1.0
+
+    nodes = [
+        helper.make_node("Transpose", ["input_1"], ["nchw"], perm=[0, 3, 1, 2]),
+        helper.make_node("AveragePool", ["nchw"], ["pooled"], kernel_shape=[pool, pool], strides=[pool, pool]),
+        helper.make_node("Reshape", ["pooled", "shape"], ["flat"]),
+        helper.make_node("Sub", ["flat", "mean"], ["centered"]),
+        helper.make_node("MatMul", ["centered", "weights"], ["logits"]),
+        helper.make_node("Add", ["logits", "bias"], ["biased"]),
+        helper.make_node("Sigmoid", ["biased"], ["predictions_sigmoid"]),
+    ]
+    graph = helper.make_graph(
+        nodes,
+        "tiny_tagger",
+        [helper.make_tensor_value_info("input_1", TensorProto.FLOAT, ["N", MODEL_INPUT_SIZE, MODEL_INPUT_SIZE, 3])],
+        [helper.make_tensor_value_info("predictions_sigmoid", TensorProto.FLOAT, ["N", num_labels])],
+        initializer=[
+            numpy_helper.from_array(np.array([-1, features], dtype=np.int64), "shape"),
+            numpy_helper.from_array(np.array(128, dtype=np.float32), "mean"),
+            numpy_helper.from_array(weights / 128, "weights"),
+            numpy_helper.from_array(bias, "bias"),
+        ],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, os.path.join(model_dir, "model.onnx"))
+
+    with open(os.path.join(model_dir, "selected_tags.csv"), "w") as f:
+        f.write("tag_id,name,category,count\n")
+        for i in range(num_labels):
+            if i < NUM_RATINGS:
+                name, category = ["general", "sensitive", "questionable", "explicit"][i], 9
+            elif i >= num_labels - NUM_CHARACTERS:
+                name, category = f"character_{i}", 4
+            else:
+                name, category = f"tag_{i}", 0
+            f.write(f"{i},{name},{category},{num_labels - i}\n")
+
+def count_images(directory, extensions):
+    return sum(f.lower().endswith(extensions) for f in os.listdir(directory))
+
+def run_case(case, corpus_dir, work_dir, model_dir):
+    """Run one tool over the corpus in this process. Returns the number of images it handled."""
+    output_dir = os.path.join(work_dir, "output")
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    if case == "center_crop_and_resize":
+        import center_crop_and_resize
+        center_crop_and_resize.process_images(corpus_dir, output_dir, 512)
+        return count_images(corpus_dir, ('.png', '.jpg', '.jpeg', '.gif', '.bmp'))
+    if case == "top_left_crop_and_resize":
+        import top_left_crop_and_resize
+        top_left_crop_and_resize.process_images(corpus_dir, output_dir, 512)
+        return count_images(corpus_dir, ('.png', '.jpg', '.jpeg', '.bmp'))
+    if case == "resize_images":
+        import resize_images
+        resize_images.resize_images(corpus_dir, output_dir, 512)
+        return count_images(corpus_dir, ('.jpeg', '.jpg'))
+    if case in ("delete_small_size_images_scan", "delete_small_size_images_scan_warm"):
+        import builtins
+        import delete_small_size_images
+        from image_index import INDEX_FILENAME
+        if case == "delete_small_size_images_scan":
+            index_path = os.path.join(corpus_dir, INDEX_FILENAME)
+            if os.path.exists(index_path):
+                os.remove(index_path)
+        # Answer "no" to the confirmation, so only the scan is measured
+        builtins.input = lambda prompt="": "no"
+        delete_small_size_images.find_and_delete_small_images(corpus_dir, 500, 500)
+        return count_images(corpus_dir, ('.png', '.jpg', '.jpeg', '.gif', '.bmp'))
+    if case == "tag_images":
+        import tag_images
+        # Captions and the manifest are written next to the images, so tag a copy
+        shutil.copytree(corpus_dir, output_dir)
+        tag_images.tag_images(
+            output_dir, "tiny-tagger", 0.35, False, 0.85, False, None,
+            batch_size=8, force=True, model_dir=model_dir
+        )
+        return count_images(output_dir, ('jpg', 'jpeg', 'png'))
+    raise ValueError(f"Unknown benchmark case: {case}")
+
+CASES = [
+    "center_crop_and_resize",
+    "top_left_crop_and_resize",
+    "resize_images",
+    "delete_small_size_images_scan",
+    "delete_small_size_images_scan_warm",
+    "tag_images",
+]
+
+def peak_rss_mb():
+    """Peak resident memory of this process and its (waited-for) children, in MiB."""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    try:
+        # VmHWM starts over at exec; ru_maxrss would include the parent's peak before it
+        with open("/proc/self/status") as f:
+            own = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except OSError:
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    peak = max(own, children)
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+def measure_case(case, corpus_dir, work_dir, model_dir, result_path):
+    """Child-process entry point: time one case and save its measurements as JSON."""
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            images = run_case(case, corpus_dir, work_dir, model_dir)
+        finally:
+            sys.stdout = stdout
+    seconds = time.perf_counter() - start
+    with open(result_path, "w") as f:
+        json.dump({
+            "images": images,
+            "seconds": round(seconds, 4),
+            "images_per_sec": round(images / seconds, 2) if seconds else None,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }, f)
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmarks(work_dir, cases=CASES, count=200, seed=0, repeat=1):
+    """
+    Build the corpus and tiny model in work_dir (once; they are reused while the
+    count and seed match) and run each case `repeat` times, every run in a fresh
+    process so peak memory is per run. Returns the report dict; the best run of
+    each case is kept.
+    """
+    corpus_dir = os.path.join(work_dir, f"corpus-{count}-{seed}")
+    model_dir = os.path.join(work_dir, "tiny_tagger")
+    if not os.path.isdir(corpus_dir):
+        print(f"Generating {count} synthetic images in {corpus_dir}")
+        make_corpus(f"{corpus_dir}.tmp", count, seed)
+        os.replace(f"{corpus_dir}.tmp", corpus_dir)
+    if not os.path.exists(os.path.join(model_dir, "model.onnx")):
+        make_tiny_tagger(model_dir)
+
+    results = {}
+    result_path = os.path.join(work_dir, "case_result.json")
+    for case in cases:
+        runs = []
+        for _ in range(repeat):
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run_case", case, work_dir,
+                 "--count", str(count), "--seed", str(seed)],
+                check=True,
+            )
+            with open(result_path) as f:
+                runs.append(json.load(f))
+        results[case] = min(runs, key=lambda run: run["seconds"])
+        print(f"{case}: {results[case]['images_per_sec']} images/sec, peak {results[case]['peak_rss_mb']} MiB")
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": {"count": count, "seed": seed},
+        "results": results,
+    }
+
+def compare(report, baseline):
+    """Print images/sec and peak memory of `report` relative to a baseline report."""
+    print(f"Compared with {baseline.get('commit')}:")
+    for case, result in report["results"].items():
+        old = baseline["results"].get(case)
+        if old is None:
+            continue
+        speed = result["images_per_sec"] / old["images_per_sec"] if old["images_per_sec"] else float("nan")
+        memory = result["peak_rss_mb"] / old["peak_rss_mb"] if old["peak_rss_mb"] else float("nan")
+        print(f"  {case}: {speed:.2f}x speed, {memory:.2f}x peak memory")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing and tagging tools on a synthetic corpus.")
+    parser.add_argument("work_dir", help="Folder for the corpus, the tiny model and tool outputs (reused between runs)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON to compare against")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES, help="Benchmarks to run")
+    parser.add_argument("--count", type=int, default=200, help="Number of synthetic images")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per benchmark; the fastest is reported")
+    parser.add_argument("--run_case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        measure_case(
+            args.run_case,
+            os.path.join(args.work_dir, f"corpus-{args.count}-{args.seed}"),
+            args.work_dir,
+            os.path.join(args.work_dir, "tiny_tagger"),
+            os.path.join(args.work_dir, "case_result.json"),
+        )
+        sys.exit(0)
+
+    report = run_benchmarks(args.work_dir, args.cases, args.count, args.seed, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
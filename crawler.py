@@ -0,0 +1,225 @@
+import io
+import sys
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from downloader import Downloader
+
+# Counts DOM changes that can bring new images: added nodes and src/srcset updates
+# (lazy loaders). Our own data-crawled-src marks are not in the filter.
+INSTALL_OBSERVER_JS = """
+window.__crawlerVersion = 0;
+new MutationObserver(() => { window.__crawlerVersion += 1; }).observe(document.documentElement, {
+    childList: true, subtree: true, attributes: true, attributeFilter: ["src", "srcset"]
+});
+"""
+
+# Returns the URLs of matching elements not reported before (or whose URL changed),
+# so each round only sends the new ones back over the WebDriver connection.
+COLLECT_JS = """
+const urls = [];
+for (const el of document.querySelectorAll(arguments[0])) {
+    const src = el.currentSrc || el.src;
+    if (src && el.dataset.crawledSrc !== src) {
+        el.dataset.crawledSrc = src;
+        urls.push(src);
+    }
+}
+return urls;
+"""
+
+SCROLL_JS = "window.scrollTo(0, document.body.scrollHeight);"
+
+# Resolves as soon as the DOM changes after version arguments[0], or with null
+# after arguments[1] ms without a change.
+WAIT_FOR_CHANGE_JS = """
+const [seen, timeout, done] = arguments;
+if (window.__crawlerVersion !== seen) {
+    done(window.__crawlerVersion);
+    return;
+}
+const observer = new MutationObserver(() => {
+    observer.disconnect();
+    clearTimeout(timer);
+    done(window.__crawlerVersion);
+});
+const timer = setTimeout(() => { observer.disconnect(); done(null); }, timeout);
+observer.observe(document.documentElement, {
+    childList: true, subtree: true, attributes: true, attributeFilter: ["src", "srcset"]
+});
+"""
+
+def make_driver(driver_path=None, headless=True):
+    """A Chrome WebDriver with the options the notebooks used; driver_path=None lets Selenium find chromedriver."""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.webdriver.chrome.service import Service
+
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    service = Service(driver_path) if driver_path else Service()
+    return webdriver.Chrome(service=service, options=chrome_options)
+
+def iter_image_urls(driver, url, selector="img", timeout=10, max_urls=None):
+    """
+    Open `url` and yield each new image URL as soon as it appears, scrolling to
+    load more. Instead of sleeping a fixed time per scroll, it waits in the page
+    for the next DOM change and continues right away; it stops once no new URL
+    has turned up for `timeout` seconds, or after `max_urls` URLs. Only http(s)
+    URLs are yielded, each once.
+    """
+    driver.set_script_timeout(timeout + 5)
+    driver.get(url)
+    driver.execute_script(INSTALL_OBSERVER_JS)
+
+    seen = set()
+    version = 0
+    last_new = time.monotonic()
+    while True:
+        for image_url in driver.execute_script(COLLECT_JS, selector):
+            if image_url in seen or urlparse(image_url).scheme not in ("http", "https"):
+                continue
+            seen.add(image_url)
+            last_new = time.monotonic()
+            yield image_url
+            if max_urls is not None and len(seen) >= max_urls:
+                return
+
+        remaining = timeout - (time.monotonic() - last_new)
+        if remaining <= 0:
+            return
+        driver.execute_script(SCROLL_JS)
+        version = driver.execute_async_script(WAIT_FOR_CHANGE_JS, version, int(remaining * 1000))
+        if version is None:
+            return
+
+def crawl_images(url, save_dir, driver=None, selector="img", timeout=10, max_urls=None, workers=8, driver_path=None):
+    """
+    Crawl `url` and download every image URL it finds into save_dir. Each URL is
+    queued on the Downloader the moment it is found, so downloads run while the
+    page is still being scrolled. Returns the saved paths (None for failures).
+    """
+    own_driver = driver is None
+    if own_driver:
+        driver = make_driver(driver_path)
+    try:
+        with Downloader(save_dir, workers=workers) as downloader:
+            futures = [downloader.submit(image_url) for image_url in iter_image_urls(driver, url, selector, timeout, max_urls)]
+            paths = [future.result() for future in futures]
+    finally:
+        if own_driver:
+            driver.quit()
+    print(f"Downloaded {sum(path is not None for path in paths)} of {len(paths)} images")
+    return paths
+
+class DemoPageHandler(BaseHTTPRequestHandler):
+    """A gallery that appends `batch` images after a delay each time it is scrolled to the bottom."""
+
+    PAGE = """<!DOCTYPE html>
+<html><body style="margin:0">
+<div id="gallery"></div>
+<script>
+let next = 0, loading = false;
+function addBatch() {{
+    for (let i = 0; i < {batch} && next < {count}; i++, next++) {{
+        const img = document.createElement("img");
+        img.src = "/img/" + next + ".png";
+        img.style = "display:block;width:256px;height:256px";
+        document.getElementById("gallery").appendChild(img);
+    }}
+    loading = false;
+}}
+window.addEventListener("scroll", () => {{
+    if (loading || next >= {count}) return;
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 10) {{
+        loading = true;
+        setTimeout(addBatch, {delay_ms});
+    }}
+}});
+setTimeout(addBatch, {delay_ms});
+</script>
+</body></html>
+"""
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        if self.path == "/":
+            page = self.PAGE.format(count=server.count, batch=server.batch, delay_ms=int(server.delay * 1000))
+            self.send_body(page.encode(), "text/html")
+        elif self.path.startswith("/img/") and self.path.endswith(".png"):
+            from PIL import Image
+            index = int(self.path[len("/img/"):-len(".png")])
+            body = io.BytesIO()
+            Image.new("RGB", (256, 256), ((index * 37) % 256, (index * 91) % 256, (index * 151) % 256)).save(body, "PNG")
+            self.send_body(body.getvalue(), "image/png")
+        else:
+            self.send_error(404)
+
+def serve_demo_page(count=60, batch=12, delay=0.5, port=0):
+    """
+    Serve a local page that loads `count` images progressively, `batch` at a time
+    `delay` seconds after each scroll, on a background thread. For trying the
+    crawler without a real site; returns the server (its URL is in server.url).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), DemoPageHandler)
+    server.daemon_threads = True
+    server.count = count
+    server.batch = batch
+    server.delay = delay
+    server.url = f"http://127.0.0.1:{server.server_port}/"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scroll a page with Selenium and download its images as they appear.")
+    parser.add_argument("url", nargs="?", help="Page to crawl (omit with --demo)")
+    parser.add_argument("--save_dir", default="downloaded_images", help="Directory to save the images in")
+    parser.add_argument("--selector", default="img", help="CSS selector of the image elements")
+    parser.add_argument("--timeout", type=float, default=10, help="Stop after this many seconds without a new image")
+    parser.add_argument("--max_urls", type=int, help="Stop after this many image URLs")
+    parser.add_argument("--workers", type=int, default=8, help="Number of concurrent downloads")
+    parser.add_argument("--driver_path", help="Path to chromedriver (default: let Selenium find it)")
+    parser.add_argument("--print_urls", action="store_true",
+                        help="Print the URLs as they are found instead of downloading, e.g. to pipe into stream_pipeline.py -")
+    parser.add_argument("--demo", action="store_true", help="Crawl a local page that loads images progressively")
+    args = parser.parse_args()
+
+    url = args.url
+    if args.demo:
+        url = serve_demo_page().url
+    elif not url:
+        parser.error("a url is required unless --demo is given")
+
+    if args.print_urls:
+        driver = make_driver(args.driver_path)
+        try:
+            for image_url in iter_image_urls(driver, url, args.selector, args.timeout, args.max_urls):
+                print(image_url, flush=True)
+        finally:
+            driver.quit()
+        sys.exit(0)
+
+    crawl_images(
+        url,
+        args.save_dir,
+        selector=args.selector,
+        timeout=args.timeout,
+        max_urls=args.max_urls,
+        workers=args.workers,
+        driver_path=args.driver_path
+    )
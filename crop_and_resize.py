@@ -0,0 +1,203 @@
+import os
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from PIL import Image
+from image_io import open_image
+from tag_cache import write_json_atomic
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+# Bucket limits, matching the trainer's --enable_bucket defaults
+BUCKET_MIN_SIZE = 256
+BUCKET_MAX_SIZE = 1024
+BUCKET_STEP = 64
+BUCKET_MANIFEST_FILENAME = "bucket_manifest.json"
+
+def center_crop_box(width, height):
+    """Largest centered square."""
+    new_size = min(width, height)
+    left = (width - new_size) / 2
+    top = (height - new_size) / 2
+    right = (width + new_size) / 2
+    bottom = (height + new_size) / 2
+    return left, top, right, bottom
+
+def top_left_crop_box(width, height):
+    """Largest square anchored at the top-left corner."""
+    new_size = min(width, height)
+    return 0, 0, new_size, new_size
+
+def square_crop(crop_box):
+    """Strategy that crops a square with `crop_box` and resizes it to target_size x target_size."""
+    def transform(img, target_size):
+        width, height = img.size
+        img_cropped = img.crop(crop_box(width, height))
+        return img_cropped.resize((target_size, target_size), Image.LANCZOS)
+    return transform
+
+def width_resize(img, target_size):
+    """Strategy that resizes to target_size wide, keeping the source aspect ratio."""
+    original_width, original_height = getattr(img, "source_size", img.size)
+    aspect_ratio = original_height / original_width
+    target_height = int(target_size * aspect_ratio)
+    return img.resize((target_size, target_height), Image.LANCZOS)
+
+@lru_cache()
+def make_buckets(resolution, min_size=BUCKET_MIN_SIZE, max_size=BUCKET_MAX_SIZE, step=BUCKET_STEP):
+    """
+    Bucket (width, height) sizes for a resolution: multiples of `step` between
+    min_size and max_size, as large as possible within resolution x resolution pixels.
+    """
+    max_area = resolution * resolution
+    buckets = {(resolution // step * step,) * 2}
+    for width in range(min_size, max_size + 1, step):
+        height = min(max_size, max_area // width // step * step)
+        if height >= min_size:
+            buckets.add((width, height))
+            buckets.add((height, width))
+    return sorted(buckets)
+
+def closest_bucket(size, buckets):
+    """The bucket whose aspect ratio is closest to that of a (width, height) size."""
+    aspect = math.log(size[0] / size[1])
+    return min(buckets, key=lambda bucket: abs(math.log(bucket[0] / bucket[1]) - aspect))
+
+def bucket_resize(img, target_size):
+    """
+    Strategy that center-crops to the aspect ratio of the closest bucket for a
+    target_size x target_size pixel budget and resizes to exactly that bucket.
+    """
+    bucket_width, bucket_height = closest_bucket(getattr(img, "source_size", img.size), make_buckets(target_size))
+    width, height = img.size
+    scale = max(bucket_width / width, bucket_height / height)
+    crop_width, crop_height = bucket_width / scale, bucket_height / scale
+    left = (width - crop_width) / 2
+    top = (height - crop_height) / 2
+    img_cropped = img.crop((left, top, left + crop_width, top + crop_height))
+    return img_cropped.resize((bucket_width, bucket_height), Image.LANCZOS)
+
+# Crop strategies: name -> (transform(img, target_size), side passed to open_image)
+STRATEGIES = {
+    "center": (square_crop(center_crop_box), "short"),
+    "top_left": (square_crop(top_left_crop_box), "short"),
+    "width": (width_resize, "width"),
+    "bucket": (bucket_resize, "short"),
+}
+
+def collect_files(source_dir, target_dir, extensions=IMAGE_EXTENSIONS, recursive=True, subfolders_only=False):
+    """
+    Return a deduplicated list of (source_path, target_path) pairs, mirroring the
+    layout of `source_dir` under `target_dir`. Every source file appears once, even
+    if it is reachable through several directories (e.g. via symlinks).
+    """
+    jobs = []
+    seen = set()
+    for root, dirs, files in os.walk(source_dir):
+        if not recursive:
+            dirs.clear()
+        if subfolders_only and os.path.samefile(root, source_dir):
+            continue
+        for file in sorted(files):
+            if not file.lower().endswith(extensions):
+                continue
+            source_path = os.path.join(root, file)
+            real_path = os.path.realpath(source_path)
+            if real_path in seen:
+                continue
+            seen.add(real_path)
+            relative_path = os.path.relpath(source_path, source_dir)
+            jobs.append((source_path, os.path.join(target_dir, relative_path)))
+    return jobs
+
+def convert_file(source_path, target_path, target_size, strategy):
+    """
+    Crop/resize one image with the named strategy. Returns (error message or None,
+    source (width, height), output (width, height)); the sizes are None on error.
+    """
+    transform, side = STRATEGIES[strategy]
+    try:
+        with open_image(source_path, target_size, side=side) as img:
+            output = transform(img, target_size)
+            output.save(target_path)
+            return None, img.source_size, output.size
+    except Exception as e:
+        return f"Error processing image {source_path}: {e}", None, None
+
+def process_file(source_path, target_path, target_size, strategy):
+    """Crop/resize one image with the named strategy. Returns an error message or None."""
+    return convert_file(source_path, target_path, target_size, strategy)[0]
+
+def _process_job(job):
+    return convert_file(*job)
+
+def process_jobs(jobs, target_size, strategy, workers=None):
+    """Run (source_path, target_path) jobs on a process pool. Returns the convert_file results, in job order."""
+    for target_dir_path in {os.path.dirname(target_path) for _, target_path in jobs}:
+        os.makedirs(target_dir_path, exist_ok=True)
+
+    tasks = [(source_path, target_path, target_size, strategy) for source_path, target_path in jobs]
+    if workers == 1:
+        return report_results(jobs, map(_process_job, tasks))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+        return report_results(jobs, executor.map(_process_job, tasks, chunksize=min(chunksize, 64)))
+
+def report_results(jobs, results):
+    """Print one line per job as results arrive, in job order. Returns the results as a list."""
+    collected = []
+    for (_, target_path), result in zip(jobs, results):
+        error = result[0]
+        print(error or f"Processed and saved {target_path}")
+        collected.append(result)
+    return collected
+
+def write_bucket_manifest(target_dir, target_size, jobs, results):
+    """
+    Save the bucket and sizes of every processed image in target_dir, so training
+    can group images by bucket without opening each one.
+    """
+    images = {}
+    for (_, target_path), (error, source_size, output_size) in zip(jobs, results):
+        if error is None:
+            images[os.path.relpath(target_path, target_dir).replace(os.sep, "/")] = {
+                "bucket": list(output_size),
+                "source_size": list(source_size),
+            }
+    manifest_path = os.path.join(target_dir, BUCKET_MANIFEST_FILENAME)
+    write_json_atomic(manifest_path, {
+        "resolution": target_size,
+        "buckets": make_buckets(target_size),
+        "images": images,
+    })
+    print(f"Wrote bucket manifest for {len(images)} images to {manifest_path}")
+
+def process_images(source_dir, target_dir, target_size, strategy="center", workers=None,
+                   extensions=IMAGE_EXTENSIONS, recursive=True, subfolders_only=False):
+    """Processes all images in the source directory with one crop strategy, in parallel."""
+    if not os.path.isdir(source_dir):
+        print("The specified source directory does not exist.")
+        return
+
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
+
+    jobs = collect_files(source_dir, target_dir, extensions, recursive, subfolders_only)
+    results = process_jobs(jobs, target_size, strategy, workers)
+    failures = sum(error is not None for error, _, _ in results)
+    print(f"Processed {len(jobs) - failures} of {len(jobs)} images")
+    if strategy == "bucket":
+        write_bucket_manifest(target_dir, target_size, jobs, results)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Crop and resize all images in a folder tree in parallel.")
+    parser.add_argument("source_dir", help="Folder containing images to process.")
+    parser.add_argument("target_dir", help="Folder to save processed images, mirroring the source layout.")
+    parser.add_argument("target_size", type=int, help="Output size (square side, width for 'width', pixel budget side for 'bucket').")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="center", help="Crop strategy.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes (default: all cores).")
+    args = parser.parse_args()
+
+    process_images(args.source_dir, args.target_dir, args.target_size, args.strategy, args.workers)
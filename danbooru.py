@@ -0,0 +1,220 @@
+import os
+import json
+import hashlib
+import itertools
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from tqdm import tqdm
+from downloader import DEFAULT_HEADERS, Downloader, RateLimiter
+from tag_cache import write_json_atomic
+
+# Set the URL for Danbooru's API
+DANBOORU_URL = 'https://danbooru.donmai.us/posts.json'
+
+MD5_INDEX_FILENAME = ".md5_index.json"
+CHECKPOINT_FILENAME = ".danbooru_checkpoint.json"
+
+def env_auth():
+    """
+    (login, api key) from DANBOORU_LOGIN and DANBOORU_API_KEY, or None when unset.
+    Credentials come from the environment so they stay out of scripts and notebooks.
+    """
+    login = os.environ.get("DANBOORU_LOGIN")
+    api_key = os.environ.get("DANBOORU_API_KEY")
+    return (login, api_key) if login and api_key else None
+
+def file_md5(path, chunk_size=1 << 20):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class Md5Index:
+    """
+    MD5s of the files in a download directory, saved next to them. Files are only
+    re-hashed when their size or mtime changes, so refreshing is cheap.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MD5_INDEX_FILENAME)
+        self.files = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.files = json.load(f)
+        self.refresh()
+
+    def refresh(self):
+        files = {}
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or entry.name.startswith("."):
+                continue
+            stat = entry.stat()
+            known = self.files.get(entry.name)
+            if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+                files[entry.name] = known
+            else:
+                files[entry.name] = [stat.st_size, stat.st_mtime_ns, file_md5(entry.path)]
+        self.files = files
+        self.md5s = {md5 for _, _, md5 in files.values()}
+
+    def __contains__(self, md5):
+        return md5 in self.md5s
+
+    def add(self, file_name, md5):
+        stat = os.stat(os.path.join(self.directory, file_name))
+        self.files[file_name] = [stat.st_size, stat.st_mtime_ns, md5]
+        self.md5s.add(md5)
+
+    def save(self):
+        write_json_atomic(self.path, self.files)
+
+def fetch_page(session, api_url, tags, limit, page, rate_limiter, timeout=30):
+    """Fetch one page of posts. Raises on HTTP errors."""
+    rate_limiter.wait()
+    response = session.get(api_url, params={'tags': tags, 'limit': limit, 'page': page}, timeout=timeout)
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to retrieve posts: {response.status_code}")
+    return response.json()
+
+def next_page(posts):
+    """Cursor of the page after `posts`: older than the oldest post seen (b<id>)."""
+    return f"b{min(post['id'] for post in posts)}"
+
+def iter_pages(session, api_url, tags, limit, page, rate_limiter, max_pages=None):
+    """
+    Yield (page, posts, next page) while the following page is already being
+    fetched in the background, so API latency overlaps with the downloads.
+    Stops at the first empty page or after `max_pages`; fetch errors are raised.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(fetch_page, session, api_url, tags, limit, page, rate_limiter)
+        for count in itertools.count(1):
+            posts = pending.result()
+            if not posts:
+                return
+
+            following = next_page(posts)
+            last = max_pages is not None and count >= max_pages
+            if not last:
+                pending = executor.submit(fetch_page, session, api_url, tags, limit, following, rate_limiter)
+            yield page, posts, following
+            if last:
+                return
+            page = following
+
+def download_page(downloader, index, posts, desc):
+    """
+    Download the posts of one page that are not in `index` yet.
+    Returns (downloaded, skipped, failed posts).
+    """
+    # Only download posts with a file URL whose content we do not have yet
+    futures = []
+    skipped = 0
+    for post in posts:
+        if not post.get('file_url'):
+            continue
+        if post.get('md5') in index:
+            skipped += 1
+            continue
+        futures.append((post, downloader.submit(post['file_url'])))
+
+    downloaded = 0
+    failed = []
+    for post, future in tqdm(futures, desc=desc):
+        path = future.result()
+        if path is None:
+            failed.append({key: post.get(key) for key in ('id', 'md5', 'file_url')})
+            continue
+        downloaded += 1
+        if post.get('md5'):
+            index.add(os.path.basename(path), post['md5'])
+    index.save()
+    return downloaded, skipped, failed
+
+def download_posts(tags, download_dir, api_url=DANBOORU_URL, limit=100, start_page=1, auth=None,
+                   workers=8, rate_limit=2.0, max_pages=None, resume=True):
+    """
+    Download all posts matching `tags` into `download_dir`.
+
+    Posts whose md5 is already in the directory are not fetched. API requests
+    are limited to `rate_limit` per second. After each page the checkpoint
+    records the next page cursor and the posts whose download failed; a later
+    run with the same tags retries those posts first and resumes from the
+    cursor. The checkpoint is deleted once every post has been downloaded.
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    checkpoint_path = os.path.join(download_dir, CHECKPOINT_FILENAME)
+    page = start_page
+    failed = []
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("tags") == tags:
+            page = checkpoint["page"]
+            failed = checkpoint.get("failed", [])
+            print(f"Resuming from page {page}" + (f", retrying {len(failed)} failed posts" if failed else ""))
+
+    index = Md5Index(download_dir)
+    rate_limiter = RateLimiter(rate_limit)
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.auth = auth
+
+    downloaded = skipped = 0
+    complete = False
+    with session, Downloader(download_dir, workers=workers) as downloader:
+        if failed:
+            downloaded, skipped, failed = download_page(downloader, index, failed, "Retrying failed posts")
+            write_json_atomic(checkpoint_path, {"tags": tags, "page": page, "failed": failed})
+
+        count = 0
+        try:
+            for count, (page, posts, following) in enumerate(iter_pages(session, api_url, tags, limit, page, rate_limiter, max_pages), 1):
+                page_downloaded, page_skipped, page_failed = download_page(downloader, index, posts, f"Downloading page {page}")
+                downloaded += page_downloaded
+                skipped += page_skipped
+                failed += page_failed
+                write_json_atomic(checkpoint_path, {"tags": tags, "page": following, "failed": failed})
+            # Ran out of posts rather than stopping at max_pages
+            complete = max_pages is None or count < max_pages
+        except Exception as e:
+            print(e)
+
+    if complete:
+        print("No more posts available.")
+        if not failed and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    print(f"Downloaded {downloaded} images, skipped {skipped} already present"
+          + (f", {len(failed)} failed (retried on the next run)" if failed else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Download Danbooru posts for a tag query.")
+    parser.add_argument("tags", help="Tag query, e.g. 'landscape rating:general'")
+    parser.add_argument("download_dir", help="Directory where images will be saved")
+    parser.add_argument("--api_url", default=DANBOORU_URL, help="posts.json endpoint")
+    parser.add_argument("--limit", type=int, default=100, help="Posts per request (max 200)")
+    parser.add_argument("--start_page", default="1", help="Page to start at when there is no checkpoint")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent image downloads")
+    parser.add_argument("--rate_limit", type=float, default=2.0, help="Maximum API requests per second")
+    parser.add_argument("--max_pages", type=int, help="Stop after this many pages")
+    parser.add_argument("--no_resume", action="store_true", help="Ignore the saved page checkpoint")
+    args = parser.parse_args()
+
+    download_posts(
+        args.tags,
+        args.download_dir,
+        api_url=args.api_url,
+        limit=args.limit,
+        start_page=args.start_page,
+        auth=env_auth(),
+        workers=args.workers,
+        rate_limit=args.rate_limit,
+        max_pages=args.max_pages,
+        resume=not args.no_resume,
+    )
+
+if __name__ == '__main__':
+    main()
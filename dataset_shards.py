@@ -0,0 +1,198 @@
+import io
+import os
+import mmap
+import json
+import tarfile
+import argparse
+from PIL import Image
+from tag_cache import write_json_atomic
+
+INDEX_FILENAME = "index.json"
+SHARD_PATTERN = "shard-{:06d}.tar"
+DEFAULT_SHARD_SIZE = 1 << 30
+
+def list_samples(source_dir):
+    """
+    Group the files below `source_dir` into samples: files sharing a relative path
+    without extension (e.g. a/img1.png and a/img1.txt) form one sample, keyed by that
+    path. Hidden files such as manifests and indexes are left out. Returns
+    [(key, [relative paths])] sorted by key, so shards are reproducible.
+    """
+    samples = {}
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file in files:
+            if file.startswith("."):
+                continue
+            relative_path = os.path.relpath(os.path.join(root, file), source_dir).replace(os.sep, "/")
+            samples.setdefault(os.path.splitext(relative_path)[0], []).append(relative_path)
+    return [(key, sorted(samples[key])) for key in sorted(samples)]
+
+def add_file(tar, source_path, relative_path):
+    """Append one file to `tar` and return (offset of its data in the tar file, size)."""
+    stat = os.stat(source_path)
+    info = tarfile.TarInfo(relative_path)
+    info.size = stat.st_size
+    info.mtime = stat.st_mtime
+    info.mode = 0o644
+    with open(source_path, "rb") as f:
+        tar.addfile(info, f)
+    # Member data is padded to whole blocks and ends where the tar offset now is
+    blocks = -(-info.size // tarfile.BLOCKSIZE)
+    return tar.offset - blocks * tarfile.BLOCKSIZE, info.size
+
+def pack(source_dir, shard_dir, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Pack a dataset folder into sequential tar shards of about `shard_size` bytes.
+
+    The shards are plain tars in the WebDataset layout (files of a sample are
+    adjacent and share a key), so they can be streamed with any tar reader or
+    unpacked with `tar x`. The files of one sample never straddle two shards.
+    index.json records, per file, the shard, data offset and size, for random
+    access without scanning the tars. Shards are written under temp names and
+    the index last, so an interrupted pack never looks complete.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = []
+    files = []
+    tar = None
+    shard_bytes = 0
+
+    def close_shard():
+        tar.close()
+        os.replace(f"{shard_path}.tmp", shard_path)
+
+    for key, relative_paths in list_samples(source_dir):
+        sample_bytes = sum(os.path.getsize(os.path.join(source_dir, p)) for p in relative_paths)
+        if tar is None or (shard_bytes and shard_bytes + sample_bytes > shard_size):
+            if tar is not None:
+                close_shard()
+            shards.append(SHARD_PATTERN.format(len(shards)))
+            shard_path = os.path.join(shard_dir, shards[-1])
+            tar = tarfile.open(f"{shard_path}.tmp", "w", format=tarfile.PAX_FORMAT)
+            shard_bytes = 0
+
+        for relative_path in relative_paths:
+            source_path = os.path.join(source_dir, relative_path)
+            offset, size = add_file(tar, source_path, relative_path)
+            files.append([relative_path, len(shards) - 1, offset, size])
+        # TarFile remembers every member it wrote; forget them to keep memory flat
+        tar.members.clear()
+        shard_bytes += sample_bytes
+
+    if tar is not None:
+        close_shard()
+    write_json_atomic(os.path.join(shard_dir, INDEX_FILENAME), {"shards": shards, "files": files})
+    print(f"Packed {len(files)} files into {len(shards)} shards in {shard_dir}")
+
+class ShardReader:
+    """
+    Reads a shard directory written by pack().
+
+    read() and sample() give random access through memory maps of the shards,
+    using the offset index. Iterating streams the samples in order, reading each
+    shard sequentially, which is the fast path for a full pass.
+    """
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        with open(os.path.join(shard_dir, INDEX_FILENAME)) as f:
+            index = json.load(f)
+        self.shards = index["shards"]
+        self.files = {path: (shard, offset, size) for path, shard, offset, size in index["files"]}
+        self.samples = {}
+        for path in self.files:
+            self.samples.setdefault(os.path.splitext(path)[0], []).append(path)
+        self.maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for shard_map in self.maps.values():
+            shard_map.close()
+        self.maps = {}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def keys(self):
+        return list(self.samples)
+
+    def shard_map(self, shard):
+        if shard not in self.maps:
+            with open(os.path.join(self.shard_dir, self.shards[shard]), "rb") as f:
+                self.maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.maps[shard]
+
+    def read(self, path):
+        """Return a file's content as a memoryview into the mapped shard (no copy)."""
+        shard, offset, size = self.files[path]
+        return memoryview(self.shard_map(shard))[offset:offset + size]
+
+    def sample(self, key):
+        """Return {extension: content} for one sample, e.g. {".png": ..., ".txt": ...}."""
+        return {os.path.splitext(path)[1]: self.read(path) for path in self.samples[key]}
+
+    def open_image(self, key, extensions=(".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp")):
+        """Open the image of a sample with PIL."""
+        for ext, data in self.sample(key).items():
+            if ext.lower() in extensions:
+                return Image.open(io.BytesIO(data))
+        raise KeyError(f"No image in sample {key}")
+
+    def __iter__(self):
+        """Yield (key, {extension: bytes}) for every sample, streaming the shards in order."""
+        key, sample = None, {}
+        for shard in self.shards:
+            with tarfile.open(os.path.join(self.shard_dir, shard), "r|") as tar:
+                for info in tar:
+                    if not info.isfile():
+                        continue
+                    member_key, ext = os.path.splitext(info.name)
+                    if member_key != key and sample:
+                        yield key, sample
+                        sample = {}
+                    key = member_key
+                    sample[ext] = tar.extractfile(info).read()
+        if sample:
+            yield key, sample
+
+def unpack(shard_dir, target_dir):
+    """Restore the original folder layout (and file mtimes) from the shards."""
+    count = 0
+    for shard in ShardReader(shard_dir).shards:
+        with tarfile.open(os.path.join(shard_dir, shard), "r|") as tar:
+            for info in tar:
+                if not info.isfile():
+                    continue
+                target_path = os.path.join(target_dir, *info.name.split("/"))
+                if not os.path.realpath(target_path).startswith(os.path.realpath(target_dir) + os.sep):
+                    print(f"Skipping unsafe path {info.name}")
+                    continue
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                with open(target_path, "wb") as f:
+                    f.write(tar.extractfile(info).read())
+                os.utime(target_path, (info.mtime, info.mtime))
+                count += 1
+    print(f"Unpacked {count} files into {target_dir}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pack a training folder into tar shards, or unpack them.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack_parser = subparsers.add_parser("pack", help="Pack a folder of images and captions into shards")
+    pack_parser.add_argument("source_dir", help="Dataset folder (e.g. the --train_data_dir)")
+    pack_parser.add_argument("shard_dir", help="Folder to write the shards and index.json to")
+    pack_parser.add_argument("--shard_size", type=int, default=DEFAULT_SHARD_SIZE >> 20, help="Target shard size in MiB")
+    unpack_parser = subparsers.add_parser("unpack", help="Restore the folder layout from shards")
+    unpack_parser.add_argument("shard_dir", help="Folder with the shards and index.json")
+    unpack_parser.add_argument("target_dir", help="Folder to restore the files into")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack(args.source_dir, args.shard_dir, args.shard_size << 20)
+    else:
+        unpack(args.shard_dir, args.target_dir)
@@ -0,0 +1,233 @@
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from image_io import open_image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+HASH_BITS = 64
+
+# DCT-II basis for pHash, computed once per process
+PHASH_SIZE = 32
+_k = np.arange(PHASH_SIZE)
+DCT_MATRIX = np.cos(np.pi * (2 * _k[None, :] + 1) * _k[:, None] / (2 * PHASH_SIZE))
+
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Flat or low-detail images (solid fills, smooth gradients) hash to near-constant
+# values that match each other regardless of content, so they are left out:
+# thumbnails whose gray levels vary less than this, and hashes this close to all
+# zeros or all ones
+MIN_THUMBNAIL_STD = 3.0
+MIN_HASH_BITS = 4
+
+# Buckets larger than this are compared block by block instead of as one g x g matrix
+COMPARE_BLOCK = 1024
+
+def popcount(values):
+    """Number of set bits of each uint64."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return POPCOUNT_TABLE[values.view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1)
+
+def pack_bits(bits):
+    """Pack a (batch, 64) boolean array into one uint64 per row."""
+    return np.packbits(bits, axis=1).view(">u8")[:, 0].astype(np.uint64)
+
+def dhash_batch(pixels):
+    """dHash of a (batch, 8, 9) grayscale array: is each pixel brighter than its left neighbour."""
+    return pack_bits((pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(pixels), -1))
+
+def phash_batch(pixels):
+    """pHash of a (batch, 32, 32) grayscale array: low DCT frequencies above their median."""
+    dct = np.einsum("ij,bjk,lk->bil", DCT_MATRIX, pixels.astype(np.float64), DCT_MATRIX)
+    low = dct[:, :8, :8].reshape(len(pixels), -1)
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return pack_bits(low > median)
+
+# Hash name -> (thumbnail size, batch hash function)
+HASHES = {
+    "dhash": ((9, 8), dhash_batch),
+    "phash": ((PHASH_SIZE, PHASH_SIZE), phash_batch),
+}
+
+def hash_files(paths, hash_name="dhash", min_std=MIN_THUMBNAIL_STD):
+    """
+    Hash a chunk of files in one NumPy batch. Returns (hashes, sizes, errors,
+    low_detail): uint64 hashes and (width, height) for the usable files, in order,
+    (path, message) for unreadable ones, and the paths of flat or low-detail
+    images whose hashes would match unrelated images.
+    """
+    (width, height), hash_batch = HASHES[hash_name]
+    thumbnails = []
+    thumbnail_paths = []
+    sizes = []
+    errors = []
+    low_detail = []
+    for path in paths:
+        try:
+            with open_image(path, max(width, height), side="short") as img:
+                thumbnail = np.asarray(img.convert("L").resize((width, height), Image.BOX), dtype=np.int16)
+                source_size = img.source_size
+        except Exception as e:
+            errors.append((path, str(e)))
+            continue
+        if thumbnail.std() < min_std:
+            low_detail.append(path)
+            continue
+        thumbnails.append(thumbnail)
+        thumbnail_paths.append(path)
+        sizes.append(source_size)
+    if not thumbnails:
+        return np.empty(0, dtype=np.uint64), sizes, errors, low_detail
+
+    hashes = hash_batch(np.stack(thumbnails))
+    bits = popcount(hashes)
+    usable = (bits >= MIN_HASH_BITS) & (bits <= HASH_BITS - MIN_HASH_BITS)
+    low_detail += [path for path, ok in zip(thumbnail_paths, usable) if not ok]
+    return hashes[usable], [size for size, ok in zip(sizes, usable) if ok], errors, low_detail
+
+def _hash_chunk(args):
+    return hash_files(*args)
+
+def hash_images(paths, hash_name="dhash", workers=None, chunk_size=256):
+    """Hash all paths on a process pool. Returns (hashed paths, hashes, sizes)."""
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    hashed_paths = []
+    hashes = []
+    sizes = []
+    skipped = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk, (chunk_hashes, chunk_sizes, errors, low_detail) in zip(
+            chunks, executor.map(_hash_chunk, [(chunk, hash_name) for chunk in chunks])
+        ):
+            for path, message in errors:
+                print(f"Error opening image {path}: {message}")
+            excluded = {path for path, _ in errors} | set(low_detail)
+            skipped += len(low_detail)
+            hashed_paths += [path for path in chunk if path not in excluded]
+            hashes.append(chunk_hashes)
+            sizes += chunk_sizes
+    if skipped:
+        print(f"Skipped {skipped} flat or low-detail images, whose hashes are not reliable")
+    hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+    return hashed_paths, hashes, sizes
+
+def close_pairs(group_hashes, max_distance, block=COMPARE_BLOCK):
+    """Yield (rows, cols) index arrays of the pairs i < j within max_distance, `block` rows at a time."""
+    positions = np.arange(len(group_hashes))
+    for start in range(0, len(group_hashes), block):
+        rows = group_hashes[start:start + block]
+        # Only columns from `start` on can be above the diagonal for these rows
+        distances = popcount(rows[:, None] ^ group_hashes[None, start:])
+        close = (distances <= max_distance) & (positions[start:][None, :] > positions[start:start + block][:, None])
+        block_rows, block_cols = np.nonzero(close)
+        yield block_rows + start, block_cols + start
+
+def find_similar_pairs(hashes, max_distance):
+    """
+    Return (i, j) pairs with Hamming distance <= max_distance, using multi-index
+    hashing: the hash is split into max_distance + 1 bit ranges, and by the
+    pigeonhole principle any close pair matches exactly on at least one of them.
+    Only hashes sharing a range value are compared, never all pairs.
+    """
+    num_chunks = max_distance + 1
+    bounds = np.linspace(0, HASH_BITS, num_chunks + 1).astype(int)
+    pairs = set()
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        keys = (hashes >> np.uint64(low)) & np.uint64((1 << (high - low)) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(sorted_keys)]
+        for start, end in zip(starts, ends):
+            if end - start < 2:
+                continue
+            group = order[start:end]
+            for rows, cols in close_pairs(hashes[group], max_distance):
+                pairs.update(zip(group[rows].tolist(), group[cols].tolist()))
+    return pairs
+
+def cluster_pairs(count, pairs):
+    """Union-find over pairs; returns clusters (lists of indexes) with more than one member."""
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    clusters = {}
+    for i in range(count):
+        clusters.setdefault(find(i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+def list_images(directory):
+    image_paths = []
+    for root, _, files in os.walk(directory):
+        for file in sorted(files):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                image_paths.append(os.path.join(root, file))
+    return image_paths
+
+def find_duplicates(directory, max_distance=4, hash_name="dhash", workers=None):
+    """
+    Return near-duplicate clusters as lists of paths. The first path of each
+    cluster is the one to keep: the highest resolution, then the largest file.
+    """
+    paths, hashes, sizes = hash_images(list_images(directory), hash_name, workers)
+    clusters = []
+    for members in cluster_pairs(len(paths), find_similar_pairs(hashes, max_distance)):
+        members.sort(key=lambda i: (-sizes[i][0] * sizes[i][1], -os.path.getsize(paths[i]), paths[i]))
+        clusters.append([paths[i] for i in members])
+    return clusters
+
+def find_and_delete_duplicates(directory, max_distance=4, hash_name="dhash", workers=None):
+    """Finds near-duplicate images and deletes all but the best copy after user confirmation."""
+    if not os.path.isdir(directory):
+        print("The specified directory does not exist.")
+        return
+
+    clusters = find_duplicates(directory, max_distance, hash_name, workers)
+    if not clusters:
+        print("No duplicate images found.")
+        return
+
+    # List images to be deleted
+    images_to_delete = []
+    print("The following duplicate images will be deleted:")
+    for cluster in clusters:
+        print(f"Keeping {cluster[0]}")
+        for image_path in cluster[1:]:
+            print(f"  {image_path}")
+            images_to_delete.append(image_path)
+
+    # Ask user for confirmation
+    confirm = input(f"Do you want to delete these {len(images_to_delete)} images? (yes/no): ").strip().lower()
+    if confirm == 'yes':
+        for image_path in images_to_delete:
+            try:
+                os.remove(image_path)
+                print(f"Deleted {image_path}")
+            except Exception as e:
+                print(f"Error deleting {image_path}: {e}")
+    else:
+        print("No images were deleted.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find and optionally delete near-duplicate images.')
+    parser.add_argument('directory', type=str, help='Path to the directory to scan (recursively)')
+    parser.add_argument('--max_distance', type=int, default=4, help='Maximum Hamming distance between hashes of duplicates')
+    parser.add_argument('--hash', choices=sorted(HASHES), default='dhash', help='Perceptual hash to use')
+    parser.add_argument('--workers', type=int, help='Number of hashing processes (default: all cores)')
+    args = parser.parse_args()
+
+    find_and_delete_duplicates(args.directory, args.max_distance, args.hash, args.workers)
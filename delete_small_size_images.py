@@ -1,15 +1,6 @@
 import os
 import sys
-from PIL import Image
-
-def get_image_size(image_path):
-    """Returns the size (width, height) of the image."""
-    try:
-        with Image.open(image_path) as img:
-            return img.size
-    except Exception as e:
-        print(f"Error opening image {image_path}: {e}")
-        return None
+from image_index import ImageIndex, open_index
 
 def find_and_delete_small_images(directory, max_width, max_height):
     """Finds images smaller than the specified size and deletes them after user confirmation."""
@@ -17,19 +8,15 @@ def find_and_delete_small_images(directory, max_width, max_height):
         print("The specified directory does not exist.")
         return
     
-    images_to_delete = []
-    
-    # Walk through all files in the directory
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                file_path = os.path.join(root, file)
-                size = get_image_size(file_path)
-                
-                if size:
-                    width, height = size
-                    if width < max_width or height < max_height:
-                        images_to_delete.append(file_path)
+    # Query the folder's metadata index instead of opening every image
+    extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+    with open_index(directory) as index:
+        for file_path, error in index.errors(extensions=extensions):
+            print(f"Error opening image {file_path}: {error}")
+        images_to_delete = [
+            file_path
+            for file_path, _, _ in index.query("width < ? OR height < ?", (max_width, max_height), extensions=extensions)
+        ]
     
     if not images_to_delete:
         print("No images found that match the criteria.")
@@ -43,12 +30,16 @@ def find_and_delete_small_images(directory, max_width, max_height):
     # Ask user for confirmation
     confirm = input("Do you want to delete these images? (yes/no): ").strip().lower()
     if confirm == 'yes':
+        deleted = []
         for image_path in images_to_delete:
             try:
                 os.remove(image_path)
+                deleted.append(image_path)
                 print(f"Deleted {image_path}")
             except Exception as e:
                 print(f"Error deleting {image_path}: {e}")
+        with ImageIndex(directory) as index:
+            index.remove(deleted)
     else:
         print("No images were deleted.")
 
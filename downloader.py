@@ -0,0 +1,198 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
+}
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class RetryableError(Exception):
+    pass
+
+class DownloadError(Exception):
+    pass
+
+class RateLimiter:
+    """Spaces calls to wait() so that at most `rate` happen per second, across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+def file_name_from_url(url):
+    """Return the last path component of a URL, without the query string."""
+    return url.split('/')[-1].split('?')[0]
+
+class Downloader:
+    """
+    Concurrent downloader over one pooled requests.Session.
+
+    Downloads run on a thread pool, with at most `per_host` requests in flight
+    per host. Bodies are streamed to a temp file in the target directory and
+    renamed into place only when complete, so a partial file is never mistaken
+    for a finished one; download_bytes() keeps the body in memory instead. Files
+    that already exist are skipped. Connection errors, timeouts and 429/5xx
+    responses are retried with exponential backoff. An optional RateLimiter caps
+    the request rate.
+    """
+
+    def __init__(self, save_dir, workers=8, per_host=4, retries=3, backoff=1.0, timeout=30,
+                 headers=None, cookies=None, auth=None, chunk_size=1 << 16, rate_limiter=None):
+        self.save_dir = save_dir
+        self.rate_limiter = rate_limiter
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        os.makedirs(save_dir, exist_ok=True)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(DEFAULT_HEADERS if headers is None else headers)
+        if cookies:
+            self.session.cookies.update(cookies)
+        self.session.auth = auth
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.host_limits = {}
+        self.host_limits_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def host_limit(self, url):
+        host = urlparse(url).netloc
+        with self.host_limits_lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_limits[host]
+
+    def submit(self, url, file_name=None):
+        """Queue a download; returns a Future resolving to the saved path, or None on failure."""
+        return self.executor.submit(self.download, url, file_name)
+
+    def download_all(self, urls):
+        """Download every URL concurrently and return the saved paths (None for failures), in order."""
+        futures = [self.submit(url) for url in urls]
+        return [future.result() for future in futures]
+
+    def download(self, url, file_name=None):
+        """Download one URL into save_dir, blocking. Returns the saved path, or None on failure."""
+        file_name = file_name or file_name_from_url(url)
+        path = os.path.join(self.save_dir, file_name)
+        if os.path.exists(path):
+            print(f"Already exists, skipping: {file_name}")
+            return path
+
+        try:
+            self.retry(url, lambda: self.fetch(url, path))
+            print(f"Downloaded: {file_name}")
+            return path
+        except DownloadError as e:
+            print(f"Failed to download image: {url} ({e})")
+            return None
+        except Exception as e:
+            print(f"An error occurred while downloading {url}: {e}")
+            return None
+
+    def download_bytes(self, url):
+        """Download one URL into memory, blocking. Returns the body, or None on failure."""
+        try:
+            return self.retry(url, lambda: self.fetch_bytes(url))
+        except DownloadError as e:
+            print(f"Failed to download image: {url} ({e})")
+            return None
+        except Exception as e:
+            print(f"An error occurred while downloading {url}: {e}")
+            return None
+
+    def retry(self, url, action):
+        """
+        Run `action` under the host limit and return its result. Connection errors,
+        timeouts and RetryableErrors are retried with exponential backoff, then re-raised.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.host_limit(url):
+                    return action()
+            except (requests.ConnectionError, requests.Timeout, RetryableError):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def get(self, url, stream=False):
+        """GET `url`, raising RetryableError or DownloadError on a non-200 status."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        response = self.session.get(url, stream=stream, timeout=self.timeout)
+        if response.status_code != 200:
+            response.close()
+            if response.status_code in RETRY_STATUSES:
+                raise RetryableError(f"HTTP {response.status_code}")
+            raise DownloadError(f"HTTP {response.status_code}")
+        return response
+
+    def fetch_bytes(self, url):
+        """Read the whole body of `url` into memory."""
+        with self.get(url) as response:
+            return response.content
+
+    def fetch(self, url, path):
+        """Stream `url` to `path` through a temp file and an atomic rename."""
+        with self.get(url, stream=True) as response:
+            fd, tmp_path = tempfile.mkstemp(dir=self.save_dir, prefix=".download-", suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download a list of URLs concurrently.")
+    parser.add_argument("url_file", help="Text file with one URL per line ('-' for stdin)")
+    parser.add_argument("save_dir", help="Directory to save the files in")
+    parser.add_argument("--workers", type=int, default=8, help="Number of concurrent downloads")
+    parser.add_argument("--per_host", type=int, default=4, help="Maximum concurrent downloads per host")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per URL on transient errors")
+    args = parser.parse_args()
+
+    with (sys.stdin if args.url_file == "-" else open(args.url_file)) as f:
+        urls = [line.strip() for line in f if line.strip()]
+
+    with Downloader(args.save_dir, workers=args.workers, per_host=args.per_host, retries=args.retries) as downloader:
+        paths = downloader.download_all(urls)
+    print(f"Downloaded {sum(path is not None for path in paths)} of {len(urls)} files")
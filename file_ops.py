@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import argparse
+
+JOURNAL_PREFIX = ".file_ops_journal-"
+
+class MovePlan:
+    """
+    An ordered list of (source, destination) renames that can be applied one
+    after another: every destination is free by the time its rename runs.
+    """
+
+    def __init__(self, ops, collisions, cycles):
+        self.ops = ops
+        self.collisions = collisions
+        self.cycles = cycles
+
+    def __len__(self):
+        return len(self.ops)
+
+    def summary(self):
+        return f"{len(self.ops)} operations ({len(self.collisions)} name collisions resolved, {self.cycles} cycles broken)"
+
+class DirectoryListings:
+    """Existence checks answered from one os.listdir per directory instead of a stat per path."""
+
+    def __init__(self):
+        self.listings = {}
+
+    def __contains__(self, path):
+        directory, name = os.path.split(path)
+        if directory not in self.listings:
+            try:
+                self.listings[directory] = set(os.listdir(directory))
+            except FileNotFoundError:
+                self.listings[directory] = set()
+        return name in self.listings[directory]
+
+def unique_path(path, is_taken, next_suffix=None):
+    """
+    `path` with the first free _1, _2, ... suffix before the extension. With a
+    `next_suffix` dict, the search for each (stem, ext) resumes where the last one
+    stopped, which is only valid while taken paths stay taken (as in plan_moves);
+    otherwise K collisions on one name would cost O(K^2) checks.
+    """
+    stem, ext = os.path.splitext(path)
+    index = 1 if next_suffix is None else next_suffix.get((stem, ext), 1)
+    while is_taken(f"{stem}_{index}{ext}"):
+        index += 1
+    if next_suffix is not None:
+        next_suffix[(stem, ext)] = index + 1
+    return f"{stem}_{index}{ext}"
+
+def plan_moves(pairs):
+    """
+    Plan moving each source to its destination without overwriting anything.
+
+    Destinations claimed twice, or held by a file that is not being moved away,
+    get a _N suffix. Renames are ordered so a file only moves once its
+    destination has been vacated, and cycles (a -> b -> a) go through a temp
+    name. Existence checks use one directory listing per directory, so planning
+    a million files takes seconds.
+    """
+    pairs = [(os.path.abspath(src), os.path.abspath(dst)) for src, dst in pairs]
+    sources = {src for src, _ in pairs}
+    existing = DirectoryListings()
+    claimed = set()
+    next_suffix = {}
+
+    def is_taken(path):
+        return path in claimed or (path in existing and path not in sources)
+
+    moves = {}
+    collisions = []
+    for src, dst in pairs:
+        if src == dst:
+            claimed.add(dst)
+            continue
+        if is_taken(dst):
+            resolved = unique_path(dst, is_taken, next_suffix)
+            collisions.append((src, dst, resolved))
+            dst = resolved
+        claimed.add(dst)
+        moves[src] = dst
+
+    # Sources whose own destination has not been vacated yet form chains and cycles
+    waiting_for = {dst: src for src, dst in moves.items() if dst in moves}
+    ops = []
+    done = set()
+
+    def unwind(freed):
+        while freed in waiting_for and waiting_for[freed] not in done:
+            src = waiting_for[freed]
+            ops.append((src, moves[src]))
+            done.add(src)
+            freed = src
+
+    for src, dst in moves.items():
+        if dst not in moves:
+            ops.append((src, dst))
+            done.add(src)
+            unwind(src)
+
+    cycles = 0
+    for src in moves:
+        if src in done:
+            continue
+        # Everything left is on a cycle: park one file, rotate the rest, then place it
+        temp = unique_path(os.path.join(os.path.dirname(src), f".file_ops_tmp{os.path.splitext(src)[1]}"), is_taken, next_suffix)
+        claimed.add(temp)
+        ops.append((src, temp))
+        done.add(src)
+        unwind(src)
+        ops.append((temp, moves[src]))
+        cycles += 1
+
+    return MovePlan(ops, collisions, cycles)
+
+def move(src, dst):
+    """Rename a file, falling back to a copy across filesystems."""
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+def write_journal(journal_path, ops):
+    """Record a plan before applying it, so it can be undone even if applying is interrupted."""
+    with open(journal_path, "w") as f:
+        f.write(json.dumps({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "ops": len(ops)}) + "\n")
+        for src, dst in ops:
+            f.write(json.dumps([src, dst]) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def apply_plan(plan, journal_path=None, verbose=False):
+    """Apply a plan in order, journaling it first. Returns the number of files moved."""
+    if journal_path is not None:
+        write_journal(journal_path, plan.ops)
+    made_dirs = set()
+    for src, dst in plan.ops:
+        directory = os.path.dirname(dst)
+        if directory not in made_dirs:
+            os.makedirs(directory, exist_ok=True)
+            made_dirs.add(directory)
+        move(src, dst)
+        if verbose:
+            print(f"Moved {src} to {dst}")
+    return len(plan.ops)
+
+def undo(journal_path, dry_run=False, verbose=False):
+    """
+    Reverse the operations of a journal, newest first. Operations that were
+    never applied (the destination is missing or the source is back) are
+    skipped, so a partially applied plan is undone correctly.
+    """
+    with open(journal_path) as f:
+        f.readline()
+        ops = [json.loads(line) for line in f if line.strip()]
+
+    undone = skipped = 0
+    for src, dst in reversed(ops):
+        if not os.path.exists(dst) or os.path.exists(src):
+            skipped += 1
+            continue
+        if verbose or dry_run:
+            print(f"{'Would move' if dry_run else 'Moved'} {dst} back to {src}")
+        if not dry_run:
+            os.makedirs(os.path.dirname(src), exist_ok=True)
+            move(dst, src)
+        undone += 1
+    print(f"{'Would undo' if dry_run else 'Undid'} {undone} operations ({skipped} not applied, skipped)")
+    return undone
+
+def run(pairs, journal_dir, dry_run=False, verbose=False):
+    """
+    Plan and apply (source, destination) moves, printing a summary. The journal
+    is written to journal_dir; a dry run prints the plan and changes nothing.
+    Returns the plan.
+    """
+    start_time = time.perf_counter()
+    plan = plan_moves(pairs)
+    for src, dst, resolved in plan.collisions:
+        print(f"Name collision: {src} goes to {resolved} instead of {dst}")
+
+    if dry_run:
+        for src, dst in plan.ops:
+            print(f"Would move {src} to {dst}")
+        print(f"Dry run: {plan.summary()}")
+        return plan
+
+    if not plan.ops:
+        print("Nothing to do.")
+        return plan
+    journal_path = os.path.join(journal_dir, f"{JOURNAL_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+    if os.path.exists(journal_path):
+        journal_path = unique_path(journal_path, os.path.exists)
+    apply_plan(plan, journal_path, verbose)
+    print(f"Applied {plan.summary()} in {time.perf_counter() - start_time:.2f}s")
+    print(f"Undo with: python file_ops.py undo {journal_path}")
+    return plan
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Undo a bulk rename/move from its journal.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    undo_parser = subparsers.add_parser("undo", help="Reverse the operations recorded in a journal")
+    undo_parser.add_argument("journal", help=f"Journal file ({JOURNAL_PREFIX}*.jsonl)")
+    undo_parser.add_argument("--dry_run", action="store_true", help="Only print what would be moved back")
+    undo_parser.add_argument("--verbose", action="store_true", help="Print every file moved back")
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.journal):
+        print(f"Error: Journal '{args.journal}' does not exist.")
+        sys.exit(1)
+    undo(args.journal, args.dry_run, args.verbose)
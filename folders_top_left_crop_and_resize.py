@@ -1,32 +1,22 @@
 import os
-import subprocess
 import sys
-
-def process_subfolders(base_folder, target_folder, target_size):
-    """Enumerates subfolders in the base folder and processes each using the top_left_crop_and_resize.py script."""
+import crop_and_resize
+
+def process_subfolders(base_folder, target_folder, target_size, workers=None):
+    """
+    Processes the images in all subfolders of the base folder with a top-left crop.
+    Files are collected in one walk and each output is written exactly once, in a
+    single process pool.
+    """
     if not os.path.isdir(base_folder):
         print("The specified base directory does not exist.")
         return
 
-    if not os.path.exists(target_folder):
-        os.makedirs(target_folder)
-
-    for root, dirs, _ in os.walk(base_folder):
-        for dir_name in dirs:
-            source_subfolder = os.path.join(root, dir_name)
-            relative_subfolder = os.path.relpath(source_subfolder, base_folder)
-            target_subfolder = os.path.join(target_folder, relative_subfolder)
-
-            # Print the operation
-            print(f"Processing {source_subfolder} to {target_subfolder}")
-
-            # Call the top_left_crop_and_resize.py script
-            subprocess.run([
-                sys.executable, 'top_left_crop_and_resize.py',
-                source_subfolder,
-                target_subfolder,
-                str(target_size)
-            ])
+    print(f"Processing subfolders of {base_folder} to {target_folder}")
+    crop_and_resize.process_images(
+        base_folder, target_folder, target_size, "top_left", workers,
+        extensions=('.png', '.jpg', '.jpeg', '.bmp'), subfolders_only=True
+    )
 
 if __name__ == '__main__':
     if len(sys.argv) != 4:
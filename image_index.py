@@ -0,0 +1,187 @@
+import os
+import sys
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+INDEX_FILENAME = ".image_index.sqlite"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    format TEXT,
+    width INTEGER,
+    height INTEGER,
+    mode TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS images_dir ON images (dir);
+CREATE INDEX IF NOT EXISTS images_dims ON images (width, height);
+"""
+
+def scan_files(directory, extensions=IMAGE_EXTENSIONS, recursive=True):
+    """
+    Yield (relative path, size, mtime_ns) for every image file below `directory`,
+    using os.scandir; with recursive=False only the files directly in it.
+    """
+    stack = [""]
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(directory, relative_dir))
+        except OSError as e:
+            print(f"Error scanning {relative_dir or directory}: {e}")
+            continue
+        with entries:
+            for entry in entries:
+                relative_path = os.path.join(relative_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(relative_path)
+                elif entry.name.lower().endswith(extensions) and entry.is_file():
+                    stat = entry.stat()
+                    yield relative_path, stat.st_size, stat.st_mtime_ns
+
+def read_header(path):
+    """Return (format, width, height, mode, error) reading only the image header."""
+    try:
+        with Image.open(path) as img:
+            return img.format, img.size[0], img.size[1], img.mode, None
+    except Exception as e:
+        return None, None, None, None, str(e)
+
+class ImageIndex:
+    """
+    SQLite index of image metadata below a root directory, stored in the root as
+    .image_index.sqlite. update() re-reads headers only for new or changed files
+    (by size and mtime), on a process pool, and forgets deleted files.
+    """
+
+    def __init__(self, directory, db_path=None):
+        self.directory = directory
+        self.db_path = db_path or os.path.join(directory, INDEX_FILENAME)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def update(self, workers=None, chunksize=256, recursive=True):
+        """
+        Bring the index up to date with the directory. With recursive=False only the
+        files directly in the root are refreshed and subfolder entries are left as
+        they are. Returns (scanned, updated, removed).
+        """
+        sql = "SELECT path, size, mtime_ns FROM images" + ("" if recursive else " WHERE dir = ''")
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in self.conn.execute(sql)}
+
+        changed = []
+        seen = set()
+        for relative_path, size, mtime_ns in scan_files(self.directory, recursive=recursive):
+            seen.add(relative_path)
+            if known.get(relative_path) != (size, mtime_ns):
+                changed.append((relative_path, size, mtime_ns))
+        removed = [path for path in known if path not in seen]
+
+        paths = [os.path.join(self.directory, relative_path) for relative_path, _, _ in changed]
+        if len(paths) < chunksize or workers == 1:
+            headers = [read_header(path) for path in paths]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                headers = list(executor.map(read_header, paths, chunksize=chunksize))
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        relative_path,
+                        os.path.dirname(relative_path),
+                        os.path.basename(relative_path),
+                        os.path.splitext(relative_path)[1].lower(),
+                        size,
+                        mtime_ns,
+                        *header,
+                    )
+                    for (relative_path, size, mtime_ns), header in zip(changed, headers)
+                ),
+            )
+            self.conn.executemany("DELETE FROM images WHERE path = ?", ((path,) for path in removed))
+        return len(seen), len(changed), len(removed)
+
+    def query(self, where="1", params=(), extensions=None, directory=None):
+        """
+        Yield (path, width, height) for indexed images matching an SQL `where` clause,
+        optionally limited to some extensions and to the files directly in `directory`
+        (relative to the index root, "" for the root itself). Paths are absolute.
+        """
+        clauses = [f"({where})", "error IS NULL"]
+        params = list(params)
+        if extensions is not None:
+            clauses.append(f"ext IN ({', '.join('?' * len(extensions))})")
+            params += list(extensions)
+        if directory is not None:
+            clauses.append("dir = ?")
+            params.append(directory)
+        sql = f"SELECT path, width, height FROM images WHERE {' AND '.join(clauses)} ORDER BY path"
+        for path, width, height in self.conn.execute(sql, params):
+            yield os.path.join(self.directory, path), width, height
+
+    def errors(self, extensions=None, directory=None):
+        """
+        Yield (path, error) for files whose header could not be read, optionally
+        limited to some extensions and to one directory, as in query().
+        """
+        clauses = ["error IS NOT NULL"]
+        params = []
+        if extensions is not None:
+            clauses.append(f"ext IN ({', '.join('?' * len(extensions))})")
+            params += list(extensions)
+        if directory is not None:
+            clauses.append("dir = ?")
+            params.append(directory)
+        sql = f"SELECT path, error FROM images WHERE {' AND '.join(clauses)} ORDER BY path"
+        for path, error in self.conn.execute(sql, params):
+            yield os.path.join(self.directory, path), error
+
+    def remove(self, paths):
+        """Drop entries for files deleted by a caller."""
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM images WHERE path = ?",
+                ((os.path.relpath(path, self.directory),) for path in paths),
+            )
+
+def open_index(directory, workers=None, recursive=True):
+    """Open the index of `directory` and refresh it (only its top folder with recursive=False)."""
+    index = ImageIndex(directory)
+    scanned, updated, removed = index.update(workers, recursive=recursive)
+    print(f"Indexed {scanned} images ({updated} updated, {removed} removed)", file=sys.stderr)
+    return index
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or refresh the image metadata index of a folder.")
+    parser.add_argument("directory", help="Folder to index (recursively).")
+    parser.add_argument("--workers", type=int, help="Number of header-reading processes (default: all cores).")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print("The specified directory does not exist.")
+        sys.exit(1)
+
+    with open_index(args.directory, args.workers) as index:
+        for path, error in index.errors():
+            print(f"Error opening image {path}: {error}")
@@ -0,0 +1,117 @@
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+# Keep at least this many source pixels per output pixel after the reduced decode,
+# so the final LANCZOS/BICUBIC resize still has real detail to filter.
+DEFAULT_OVERSAMPLE = 2
+
+# Modes Image.reduce() supports
+REDUCIBLE_MODES = {"L", "LA", "RGB", "RGBA", "RGBa", "La", "I", "F", "CMYK"}
+
+def side_length(size, side):
+    """Return the length of `side` ("short", "long" or "width") of a (width, height) size."""
+    width, height = size
+    if side == "short":
+        return min(width, height)
+    if side == "long":
+        return max(width, height)
+    if side == "width":
+        return width
+    raise ValueError(f"Unknown side: {side}")
+
+def open_image(image_path, target_size=None, side="short", oversample=DEFAULT_OVERSAMPLE):
+    """
+    Open an image that will be downscaled so its `side` ends up `target_size` pixels long.
+
+    JPEGs are decoded straight at a reduced scale (1/2, 1/4 or 1/8) with draft(),
+    which skips most of the decode work. Other formats are decoded fully and then
+    shrunk by an integer factor with Image.reduce(), which is much cheaper than a
+    LANCZOS pass over the full image. The result's `side` always stays at least
+    `oversample * target_size` pixels, so callers crop and resize it as before.
+    Without a target size, this is plain Image.open().
+
+    The returned image has a `source_size` attribute holding the full-resolution
+    (width, height), for callers that need the exact original aspect ratio.
+    """
+    img = Image.open(image_path)
+    source_size = img.size
+    img.source_size = source_size
+    if not target_size:
+        return img
+
+    factor = side_length(source_size, side) // (target_size * oversample)
+    if factor < 2:
+        return img
+
+    width, height = source_size
+    if img.format == "JPEG":
+        img.draft(None, (width // factor, height // factor))
+        return img
+
+    if img.mode not in REDUCIBLE_MODES:
+        return img
+    with img:
+        img.load()
+        reduced = img.reduce(factor)
+    reduced.source_size = source_size
+    return reduced
+
+def compare_with_full_decode(image_path, target_size, side="short"):
+    """
+    Resize an image to `target_size` along `side` once from a full decode and once
+    through open_image, and return the mean absolute pixel difference and the PSNR.
+    """
+    outputs = []
+    for reduced in (False, True):
+        with (open_image(image_path, target_size, side) if reduced else Image.open(image_path)) as img:
+            img = img.convert("RGB")
+            scale = target_size / side_length(img.size, side)
+            size = (max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale)))
+            outputs.append(np.asarray(img.resize(size, Image.LANCZOS), dtype=np.float64))
+
+    full, reduced = outputs
+    if full.shape != reduced.shape:
+        # Rounding of the reduced size can shift the output by a pixel; compare the overlap
+        height = min(full.shape[0], reduced.shape[0])
+        width = min(full.shape[1], reduced.shape[1])
+        full, reduced = full[:height, :width], reduced[:height, :width]
+    mse = np.mean((full - reduced) ** 2)
+    psnr = float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+    return np.mean(np.abs(full - reduced)), psnr
+
+def check_quality(source_dir, target_size, max_mean_abs_diff=2.0, min_psnr=35.0):
+    """
+    Compare the reduced-decode path against a full decode for every image in
+    `source_dir` and report images outside the tolerance. Returns True if all pass.
+    """
+    failures = 0
+    checked = 0
+    for root, _, files in os.walk(source_dir):
+        for file in files:
+            if not file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+                continue
+            image_path = os.path.join(root, file)
+            try:
+                mean_abs_diff, psnr = compare_with_full_decode(image_path, target_size)
+            except Exception as e:
+                print(f"Error processing image {image_path}: {e}")
+                continue
+            checked += 1
+            if mean_abs_diff > max_mean_abs_diff or psnr < min_psnr:
+                failures += 1
+                print(f"Out of tolerance: {image_path} (mean abs diff {mean_abs_diff:.2f}, PSNR {psnr:.1f} dB)")
+
+    print(f"Checked {checked} images, {failures} out of tolerance")
+    return failures == 0
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python image_io.py <source_dir> <target_size>")
+        sys.exit(1)
+
+    SOURCE_DIR = sys.argv[1]
+    TARGET_SIZE = int(sys.argv[2])
+
+    sys.exit(0 if check_quality(SOURCE_DIR, TARGET_SIZE) else 1)
@@ -1,6 +1,6 @@
 import os
 import sys
-from PIL import Image
+from image_index import open_index
 
 def list_image_resolutions(folder_path):
     # Check if the folder exists
@@ -8,16 +8,13 @@ def list_image_resolutions(folder_path):
         print(f"Error: The folder '{folder_path}' does not exist.")
         return
 
-    # List all files in the folder
-    for file_name in os.listdir(folder_path):
-        if file_name.lower().endswith(('.jpeg', '.jpg')):
-            file_path = os.path.join(folder_path, file_name)
-            try:
-                with Image.open(file_path) as img:
-                    width, height = img.size
-                    print(f"{file_name}: {width}x{height}")
-            except Exception as e:
-                print(f"Error processing {file_name}: {e}")
+    # Sizes come from the folder's metadata index, which only re-reads changed files;
+    # only the top folder is listed, so subfolders are not scanned
+    with open_index(folder_path, recursive=False) as index:
+        for file_path, width, height in index.query(extensions=('.jpeg', '.jpg'), directory=""):
+            print(f"{os.path.basename(file_path)}: {width}x{height}")
+        for file_path, error in index.errors(extensions=('.jpeg', '.jpg'), directory=""):
+            print(f"Error processing {os.path.basename(file_path)}: {error}")
 
 if __name__ == "__main__":
     if len(sys.argv) != 2:
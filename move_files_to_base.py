@@ -1,39 +1,44 @@
 import os
-import shutil
-import sys
+import argparse
+import file_ops
 
-def move_files_to_base(base_folder):
-    """Move all files from subfolders to the base folder and delete the subfolders."""
+def move_files_to_base(base_folder, dry_run=False, verbose=False):
+    """
+    Move all files from subfolders to the base folder and delete the subfolders.
+    Files with the same name get a _N suffix instead of overwriting each other.
+    """
     if not os.path.isdir(base_folder):
         print("The specified base directory does not exist.")
         return
 
-    for root, dirs, files in os.walk(base_folder, topdown=False):
-        for file_name in files:
-            source_file = os.path.join(root, file_name)
-            destination_file = os.path.join(base_folder, file_name)
-
-            try:
-                # Move file to base folder
-                print(f"Moving {source_file} to {destination_file}")
-                shutil.move(source_file, destination_file)
-            except Exception as e:
-                print(f"Error moving file {source_file}: {e}")
+    pairs = []
+    for root, dirs, files in os.walk(base_folder):
+        if os.path.samefile(root, base_folder):
+            continue
+        for file_name in sorted(files):
+            pairs.append((os.path.join(root, file_name), os.path.join(base_folder, file_name)))
+    file_ops.run(pairs, base_folder, dry_run=dry_run, verbose=verbose)
+    if dry_run:
+        return
 
-        # Remove empty directories
+    # Remove empty directories
+    removed = 0
+    for root, dirs, files in os.walk(base_folder, topdown=False):
         for dir_name in dirs:
             dir_path = os.path.join(root, dir_name)
             try:
                 if not os.listdir(dir_path):  # Check if the directory is empty
-                    print(f"Removing empty directory {dir_path}")
                     os.rmdir(dir_path)
+                    removed += 1
             except Exception as e:
                 print(f"Error removing directory {dir_path}: {e}")
+    print(f"Removed {removed} empty directories")
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print("Usage: python move_files_to_base.py <base_folder>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Move all files from subfolders into the base folder.")
+    parser.add_argument("base_folder", help="Folder whose subfolders are flattened into it")
+    parser.add_argument("--dry_run", action="store_true", help="Print the moves without applying them")
+    parser.add_argument("--verbose", action="store_true", help="Print every move")
+    args = parser.parse_args()
 
-    BASE_FOLDER = sys.argv[1]
-    move_files_to_base(BASE_FOLDER)
+    move_files_to_base(args.base_folder, args.dry_run, args.verbose)
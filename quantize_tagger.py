@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+from tag_images import Predictor, load_image, prepare_image, quantized_model_path
+
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png')
+
+def list_images(image_dir, count=None):
+    image_files = sorted(f for f in os.listdir(image_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    return [os.path.join(image_dir, f) for f in image_files[:count]]
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """Feeds our own images, prepared exactly as tag_images does, to static quantization."""
+
+    def __init__(self, image_paths, input_name, target_size):
+        self.image_paths = iter(image_paths)
+        self.input_name = input_name
+        self.target_size = target_size
+
+    def get_next(self):
+        for image_path in self.image_paths:
+            try:
+                _, image = load_image(image_path, self.target_size)
+            except Exception as e:
+                print(f"Skipping {image_path}: {e}")
+                continue
+            return {self.input_name: prepare_image(image, self.target_size)}
+        return None
+
+def quantize_model(model_name, mode="dynamic", calibration_dir=None, calibration_count=64, model_dir=None, model_cache_dir=None):
+    """
+    Write an int8 copy of the tagger where Predictor(precision="int8") looks for it.
+
+    "dynamic" quantizes the MatMul/Gemm weights and computes activation scales at
+    run time; it needs no data and suits the transformer taggers. "static" also
+    fixes activation scales from `calibration_count` images of `calibration_dir`
+    (QDQ format), which is faster at run time when calibrated on our own data.
+    """
+    predictor = Predictor(model_dir=model_dir, model_cache_dir=model_cache_dir)
+    _, model_path = predictor.download_model(model_name)
+    output_path = quantized_model_path(model_path, model_cache_dir)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+
+    start_time = time.perf_counter()
+    if mode == "dynamic":
+        quantize_dynamic(model_path, tmp_path, op_types_to_quantize=["MatMul", "Gemm"], weight_type=QuantType.QInt8)
+    else:
+        if not calibration_dir:
+            raise ValueError("Static quantization needs a calibration_dir of images")
+        predictor.load_model(model_name)
+        reader = ImageCalibrationReader(
+            list_images(calibration_dir, calibration_count),
+            predictor.model.get_inputs()[0].name,
+            predictor.model_target_size,
+        )
+        quantize_static(
+            model_path,
+            tmp_path,
+            reader,
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+    os.replace(tmp_path, output_path)
+
+    print(
+        f"Wrote {mode} int8 model to {output_path} in {time.perf_counter() - start_time:.1f}s "
+        f"({os.path.getsize(model_path) / 2**20:.1f} MiB -> {os.path.getsize(output_path) / 2**20:.1f} MiB)"
+    )
+    return output_path
+
+def tag_sets(results):
+    """The selected general and character tag names of each image."""
+    return [set(general_res) | set(character_res) for _, character_res, general_res in results]
+
+def time_predictions(predictor, model_name, images, batch_size):
+    """Run all images through a predictor after one warm-up batch. Returns (probabilities, images/sec)."""
+    predictor.run_model(images[:batch_size], model_name)
+    start_time = time.perf_counter()
+    preds = np.concatenate([
+        predictor.run_model(images[start:start + batch_size], model_name)
+        for start in range(0, len(images), batch_size)
+    ])
+    return preds, len(images) / (time.perf_counter() - start_time)
+
+def compare_precisions(model_name, image_dir, general_thresh=0.35, general_mcut_enabled=False, character_thresh=0.85,
+                       character_mcut_enabled=False, count=200, batch_size=8, model_dir=None, model_cache_dir=None):
+    """
+    Tag the same images with the fp32 and int8 models and report throughput and
+    how well the int8 tags agree with the fp32 ones at the given thresholds
+    (precision and recall, treating the fp32 tags as ground truth).
+    """
+    predictors = {
+        precision: Predictor(model_dir=model_dir, model_cache_dir=model_cache_dir, precision=precision)
+        for precision in ("fp32", "int8")
+    }
+    for predictor in predictors.values():
+        predictor.load_model(model_name)
+
+    # Decode once, so only the model runs are timed
+    target_size = predictors["fp32"].model_target_size
+    images = [load_image(image_path, target_size)[1] for image_path in list_images(image_dir, count)]
+    if not images:
+        raise ValueError(f"No images found in {image_dir}")
+
+    preds, rates, tags = {}, {}, {}
+    for precision, predictor in predictors.items():
+        preds[precision], rates[precision] = time_predictions(predictor, model_name, images, batch_size)
+        tags[precision] = tag_sets(predictor.process_predictions(
+            preds[precision],
+            general_thresh,
+            general_mcut_enabled,
+            character_thresh,
+            character_mcut_enabled
+        ))
+
+    true_positives = sum(len(fp32 & int8) for fp32, int8 in zip(tags["fp32"], tags["int8"]))
+    int8_total = sum(len(int8) for int8 in tags["int8"])
+    fp32_total = sum(len(fp32) for fp32 in tags["fp32"])
+    return {
+        "model": model_name,
+        "images": len(images),
+        "batch_size": batch_size,
+        "thresholds": {
+            "general_thresh": general_thresh,
+            "general_mcut_enabled": general_mcut_enabled,
+            "character_thresh": character_thresh,
+            "character_mcut_enabled": character_mcut_enabled,
+        },
+        "fp32_images_per_sec": rates["fp32"],
+        "int8_images_per_sec": rates["int8"],
+        "speedup": rates["int8"] / rates["fp32"],
+        "precision": true_positives / int8_total if int8_total else 1.0,
+        "recall": true_positives / fp32_total if fp32_total else 1.0,
+        "identical_captions": sum(fp32 == int8 for fp32, int8 in zip(tags["fp32"], tags["int8"])) / len(images),
+        "max_abs_prob_diff": float(np.abs(preds["fp32"] - preds["int8"]).max()),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Make an int8 copy of the tagger model and compare it with fp32.")
+    parser.add_argument("--model_name", default="SmilingWolf/wd-v1-4-swinv2-tagger-v2", help="Hugging Face model name")
+    parser.add_argument("--model_dir", help="Local directory with model.onnx and selected_tags.csv (no network access)")
+    parser.add_argument("--model_cache_dir", help="Directory for cached models; the int8 copy is written there too")
+    parser.add_argument("--mode", choices=["dynamic", "static"], default="dynamic", help="Quantization method")
+    parser.add_argument("--calibration_dir", help="Folder of our own images to calibrate static quantization with")
+    parser.add_argument("--calibration_count", type=int, default=64, help="Number of calibration images")
+    parser.add_argument("--report_dir", help="Folder of images to compare fp32 and int8 tags and speed on")
+    parser.add_argument("--report_count", type=int, default=200, help="Number of images to compare on")
+    parser.add_argument("--report_json", help="Also write the comparison to this JSON file")
+    parser.add_argument("--batch_size", type=int, default=8, help="Number of images per inference call in the comparison")
+    parser.add_argument("--general_thresh", type=float, default=0.35, help="Threshold for general tags")
+    parser.add_argument("--general_mcut_enabled", action="store_true", help="Use MCut threshold for general tags")
+    parser.add_argument("--character_thresh", type=float, default=0.85, help="Threshold for character tags")
+    parser.add_argument("--character_mcut_enabled", action="store_true", help="Use MCut threshold for character tags")
+    parser.add_argument("--skip_quantize", action="store_true", help="Only run the comparison against an existing int8 model")
+    args = parser.parse_args()
+
+    if not args.skip_quantize:
+        quantize_model(
+            args.model_name,
+            args.mode,
+            args.calibration_dir,
+            args.calibration_count,
+            args.model_dir,
+            args.model_cache_dir
+        )
+
+    if args.report_dir:
+        report = compare_precisions(
+            args.model_name,
+            args.report_dir,
+            args.general_thresh,
+            args.general_mcut_enabled,
+            args.character_thresh,
+            args.character_mcut_enabled,
+            args.report_count,
+            args.batch_size,
+            args.model_dir,
+            args.model_cache_dir
+        )
+        print(
+            f"fp32 {report['fp32_images_per_sec']:.2f} images/sec, int8 {report['int8_images_per_sec']:.2f} images/sec "
+            f"({report['speedup']:.2f}x)\n"
+            f"int8 tags vs fp32 over {report['images']} images: precision {report['precision']:.4f}, "
+            f"recall {report['recall']:.4f}, identical captions {report['identical_captions']:.1%}, "
+            f"max probability difference {report['max_abs_prob_diff']:.4f}"
+        )
+        if args.report_json:
+            with open(args.report_json, "w") as f:
+                json.dump(report, f, indent=2)
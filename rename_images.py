@@ -1,7 +1,9 @@
 import os
 import sys
+import argparse
+import file_ops
 
-def rename_files_in_directory(directory):
+def rename_files_in_directory(directory, dry_run=False, verbose=False):
     # Get a sorted list of all .jpeg files in the directory
     files = sorted([f for f in os.listdir(directory) if f.endswith('.jpeg')])
 
@@ -9,35 +11,28 @@ def rename_files_in_directory(directory):
     num_files = len(files)
     num_digits = len(str(num_files))
 
-    # Rename each file to a zero-padded sequential number
-    for index, filename in enumerate(files, start=1):
-        # Construct the old and new file paths
-        old_file_path = os.path.join(directory, filename)
-        
-        # Format the new file name with leading zeros
-        new_file_name = f"{index:0{num_digits}}.jpeg"
-        new_file_path = os.path.join(directory, new_file_name)
-
-        # Rename the file
-        os.rename(old_file_path, new_file_path)
-        print(f"Renamed '{filename}' to '{new_file_name}'")
+    # Map each file to a zero-padded sequential number. The engine orders the
+    # renames so no file is overwritten, even when targets are existing names.
+    pairs = [
+        (os.path.join(directory, filename), os.path.join(directory, f"{index:0{num_digits}}.jpeg"))
+        for index, filename in enumerate(files, start=1)
+    ]
+    return file_ops.run(pairs, directory, dry_run=dry_run, verbose=verbose)
 
 def main():
-    # Check if directory path is provided as an argument
-    if len(sys.argv) != 2:
-        print("Usage: python rename_images.py <directory_path>")
-        sys.exit(1)
-
-    directory_path = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Rename the .jpeg files of a folder to 1.jpeg, 2.jpeg, ...")
+    parser.add_argument("directory_path", help="Folder containing the .jpeg files")
+    parser.add_argument("--dry_run", action="store_true", help="Print the renames without applying them")
+    parser.add_argument("--verbose", action="store_true", help="Print every rename")
+    args = parser.parse_args()
 
     # Check if the provided directory exists
-    if not os.path.isdir(directory_path):
-        print(f"Error: Directory '{directory_path}' does not exist.")
+    if not os.path.isdir(args.directory_path):
+        print(f"Error: Directory '{args.directory_path}' does not exist.")
         sys.exit(1)
 
     # Call the function to rename the files
-    rename_files_in_directory(directory_path)
+    rename_files_in_directory(args.directory_path, args.dry_run, args.verbose)
 
 if __name__ == "__main__":
     main()
-
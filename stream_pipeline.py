@@ -0,0 +1,249 @@
+import io
+import os
+import sys
+import argparse
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from queue import Queue
+from PIL import Image
+from tqdm import tqdm
+from crop_and_resize import IMAGE_EXTENSIONS, STRATEGIES
+from downloader import Downloader, file_name_from_url
+from image_io import open_image
+
+def iter_bounded(executor, func, items, max_pending):
+    """
+    Yield func(item) for every item as results complete, keeping at most
+    `max_pending` calls submitted but not yet consumed. This is the bounded queue
+    between two stages: a slow consumer stalls the producer instead of letting
+    results pile up in memory. Items are pulled from `items` lazily, and finished
+    results are passed on between items, so a live input (e.g. a crawler) streams
+    through instead of waiting for the window to fill.
+    """
+    pending = set()
+    for item in items:
+        # Block only when the window is full; otherwise just collect what is done
+        done, pending = wait(pending, timeout=None if len(pending) >= max_pending else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+        pending.add(executor.submit(func, item))
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+def output_name(url):
+    """File name for the image downloaded from `url`; non-image names get .png appended."""
+    name = file_name_from_url(url)
+    if not name.lower().endswith(IMAGE_EXTENSIONS):
+        name += ".png"
+    return name
+
+def decode_and_crop(name, data, target_size, strategy, min_width=0, min_height=0):
+    """
+    Decode downloaded bytes, drop images below the minimum size and crop/resize the
+    rest. Returns (name, image, None) or (name, None, reason it was dropped).
+    """
+    transform, side = STRATEGIES[strategy]
+    try:
+        with open_image(io.BytesIO(data), target_size, side=side) as img:
+            width, height = img.source_size
+            if width < min_width or height < min_height:
+                return name, None, f"too small ({width}x{height})"
+            return name, transform(img, target_size), None
+    except Exception as e:
+        return name, None, f"cannot decode: {e}"
+
+class SampleWriter:
+    """Saves images and their captions on a background thread, fed through a bounded queue."""
+
+    def __init__(self, output_dir, max_pending=64):
+        self.output_dir = output_dir
+        self.queue = Queue(maxsize=max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            name, image, caption = item
+            try:
+                self.save(name, image, caption)
+            except Exception as e:
+                self.error = e
+
+    def save(self, name, image, caption):
+        # Image first, then caption: a caption on disk means its image is complete
+        path = os.path.join(self.output_dir, name)
+        tmp_path = os.path.join(self.output_dir, f".{name}.tmp")
+        image_format = Image.registered_extensions()[os.path.splitext(name)[1].lower()]
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(tmp_path, format=image_format)
+        os.replace(tmp_path, path)
+        if caption is not None:
+            with open(f"{os.path.splitext(path)[0]}.txt", "w") as f:
+                f.write(caption)
+
+    def write(self, name, image, caption=None):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((name, image, caption))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+def make_tagger(model_name, general_thresh, general_mcut_enabled, character_thresh, character_mcut_enabled,
+                add_tags=None, model_dir=None, model_cache_dir=None):
+    """Load the tag_images model and return a function mapping a list of images to captions."""
+    # onnxruntime and the model are only needed when tagging
+    from tag_images import Predictor, format_tags
+
+    predictor = Predictor(model_dir=model_dir, model_cache_dir=model_cache_dir)
+    predictor.load_model(model_name)
+
+    def tag(images):
+        results = predictor.predict_batch(
+            images,
+            model_name,
+            general_thresh,
+            general_mcut_enabled,
+            character_thresh,
+            character_mcut_enabled
+        )
+        return [format_tags(general_res, add_tags) for _, _, general_res in results]
+    return tag
+
+def stream_images(urls, output_dir, target_size, strategy="center", min_width=0, min_height=0,
+                  tagger=None, batch_size=8, fetch_workers=8, decode_workers=4, max_pending=64):
+    """
+    Download `urls` and turn them into training-ready images (and captions, with a
+    `tagger`) in `output_dir`, keeping every image in memory between the stages:
+
+        fetch (fetch_workers threads) -> decode, size filter, crop/resize
+        (decode_workers threads) -> tag (this thread, in batches) -> write (one thread)
+
+    Each image is decoded once and written once. Stages run concurrently and are
+    joined by bounded queues of `max_pending` items, so memory stays flat however
+    many URLs there are. `urls` is consumed lazily and may be a live generator.
+    Images already in `output_dir` (with their caption, when tagging) are skipped.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    counts = {"saved": 0, "dropped": 0, "skipped": 0}
+    seen = set()
+
+    def new_urls():
+        for url in urls:
+            name = output_name(url)
+            path = os.path.join(output_dir, name)
+            caption_path = f"{os.path.splitext(path)[0]}.txt"
+            if name in seen or (os.path.exists(path) and (tagger is None or os.path.exists(caption_path))):
+                counts["skipped"] += 1
+                continue
+            seen.add(name)
+            yield url
+
+    def fetch(url):
+        return output_name(url), downloader.download_bytes(url)
+
+    def process(item):
+        name, data = item
+        if data is None:
+            return name, None, "download failed"
+        return decode_and_crop(name, data, target_size, strategy, min_width, min_height)
+
+    batch = []
+
+    def flush():
+        captions = tagger([image for _, image in batch]) if tagger else [None] * len(batch)
+        for (name, image), caption in zip(batch, captions):
+            writer.write(name, image, caption)
+        counts["saved"] += len(batch)
+        batch.clear()
+
+    writer = SampleWriter(output_dir, max_pending)
+    try:
+        with Downloader(output_dir, workers=fetch_workers) as downloader, \
+                ThreadPoolExecutor(max_workers=decode_workers) as decoder:
+            fetched = iter_bounded(downloader.executor, fetch, new_urls(), max_pending)
+            processed = iter_bounded(decoder, process, fetched, max_pending)
+            for name, image, reason in tqdm(processed, desc="Processing images"):
+                if image is None:
+                    print(f"Dropped {name}: {reason}")
+                    counts["dropped"] += 1
+                    continue
+                batch.append((name, image))
+                if len(batch) >= (batch_size if tagger else 1):
+                    flush()
+            flush()
+    finally:
+        writer.close()
+
+    print(f"Saved {counts['saved']} images, dropped {counts['dropped']}, skipped {counts['skipped']} already present")
+    return counts
+
+def read_urls(f):
+    """Yield URLs from a text file one line at a time, so a crawler can pipe them in as it finds them."""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield line
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Download, filter, crop and optionally tag images in one streaming pass.")
+    parser.add_argument("url_file", help="Text file with one URL per line ('-' for stdin, e.g. piped from a crawler)")
+    parser.add_argument("output_dir", help="Folder for the final images and captions")
+    parser.add_argument("target_size", type=int, help="Output size (square side, or width for the 'width' strategy)")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="center", help="Crop strategy")
+    parser.add_argument("--min_width", type=int, default=0, help="Drop images narrower than this")
+    parser.add_argument("--min_height", type=int, default=0, help="Drop images shorter than this")
+    parser.add_argument("--fetch_workers", type=int, default=8, help="Concurrent downloads")
+    parser.add_argument("--decode_workers", type=int, default=4, help="Threads decoding and cropping images")
+    parser.add_argument("--max_pending", type=int, default=64, help="Capacity of each queue between stages")
+    parser.add_argument("--tag", action="store_true", help="Write a caption next to each image with the tagger model")
+    parser.add_argument("--model_name", default="SmilingWolf/wd-v1-4-swinv2-tagger-v2", help="Hugging Face model name")
+    parser.add_argument("--general_thresh", type=float, default=0.35, help="Threshold for general tags")
+    parser.add_argument("--general_mcut_enabled", action="store_true", help="Use MCut threshold for general tags")
+    parser.add_argument("--character_thresh", type=float, default=0.85, help="Threshold for character tags")
+    parser.add_argument("--character_mcut_enabled", action="store_true", help="Use MCut threshold for character tags")
+    parser.add_argument("--add_tags", nargs="+", help="List of tags to prepend to each image's tags")
+    parser.add_argument("--batch_size", type=int, default=8, help="Number of images per inference call")
+    parser.add_argument("--model_dir", help="Local directory with model.onnx and selected_tags.csv (no network access)")
+    parser.add_argument("--model_cache_dir", help="Directory for the optimized ONNX graph and parsed labels")
+    args = parser.parse_args()
+
+    tagger = None
+    if args.tag:
+        tagger = make_tagger(
+            args.model_name,
+            args.general_thresh,
+            args.general_mcut_enabled,
+            args.character_thresh,
+            args.character_mcut_enabled,
+            args.add_tags,
+            args.model_dir,
+            args.model_cache_dir
+        )
+
+    with (sys.stdin if args.url_file == "-" else open(args.url_file)) as f:
+        stream_images(
+            read_urls(f),
+            args.output_dir,
+            args.target_size,
+            strategy=args.strategy,
+            min_width=args.min_width,
+            min_height=args.min_height,
+            tagger=tagger,
+            batch_size=args.batch_size,
+            fetch_workers=args.fetch_workers,
+            decode_workers=args.decode_workers,
+            max_pending=args.max_pending,
+        )
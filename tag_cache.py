@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+PROBS_FILENAME = "probs.f16"
+INDEX_FILENAME = "index.json"
+JOURNAL_FILENAME = "index.jsonl"
+LABELS_FILENAME = "labels.npz"
+
+def file_hash(path, chunk_size=1 << 20):
+    """Return the SHA-1 hex digest of a file's content."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and move it into place so readers never see a partial file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def save_labels(path, tag_names, rating_indexes, general_indexes, character_indexes):
+    """Save the output of tag_images.load_labels as an .npz file."""
+    np.savez(
+        path,
+        tag_names=np.array(tag_names, dtype=str),
+        rating_indexes=rating_indexes,
+        general_indexes=general_indexes,
+        character_indexes=character_indexes,
+    )
+
+def read_labels(path):
+    """Read labels saved by save_labels, in the same form as tag_images.load_labels."""
+    with np.load(path) as labels:
+        return (
+            labels["tag_names"].tolist(),
+            labels["rating_indexes"],
+            labels["general_indexes"],
+            labels["character_indexes"],
+        )
+
+class ProbabilityCache:
+    """
+    On-disk store of raw tagger outputs, one float16 row per image content hash.
+
+    Each model repo gets its own directory holding an append-only float16 matrix
+    (read back through np.memmap), a JSON index mapping content hashes to rows,
+    and the label arrays needed to turn rows back into tags without the model.
+    The index also remembers (size, mtime) per file path so unchanged files do
+    not have to be re-hashed. During a run, each flush appends only the new
+    entries to index.jsonl; close() folds them into index.json.
+    """
+
+    def __init__(self, cache_dir, model_repo, flush_every=1000):
+        self.dir = os.path.join(cache_dir, model_repo.replace("/", "--"))
+        os.makedirs(self.dir, exist_ok=True)
+        self.probs_path = os.path.join(self.dir, PROBS_FILENAME)
+        self.index_path = os.path.join(self.dir, INDEX_FILENAME)
+        self.labels_path = os.path.join(self.dir, LABELS_FILENAME)
+        self.journal_path = os.path.join(self.dir, JOURNAL_FILENAME)
+        self.flush_every = flush_every
+        self.unflushed = 0
+        # Decoder threads hash files while the main thread adds and flushes rows
+        self.lock = threading.Lock()
+        # Entries added since the last flush, appended to the journal by flush()
+        self.new_rows = {}
+        self.new_files = {}
+
+        self.num_labels = None
+        self.rows = {}
+        self.files = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                index = json.load(f)
+            self.num_labels = index["num_labels"]
+            self.rows = index["rows"]
+            self.files = index["files"]
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn write from an interrupted run
+                        continue
+                    self.num_labels = entry["num_labels"]
+                    self.rows.update(entry["rows"])
+                    self.files.update(entry["files"])
+
+        # Rows appended after the last index flush (e.g. by a killed run) are dropped
+        row_bytes = (self.num_labels or 0) * 2
+        if os.path.exists(self.probs_path):
+            with open(self.probs_path, "r+b") as f:
+                f.truncate(len(self.rows) * row_bytes)
+        self.probs_file = open(self.probs_path, "ab")
+        self.journal_file = open(self.journal_path, "a")
+        if self.journal_file.tell() > 0:
+            # Terminate a torn last line so the next entry starts on its own line
+            with open(self.journal_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.journal_file.write("\n")
+        self.probs = None
+
+    def file_key(self, path):
+        """Return the content hash of a file, reusing the stored one if size and mtime match. Thread-safe."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        key = file_hash(path)
+        with self.lock:
+            self.files[path] = self.new_files[path] = [stat.st_size, stat.st_mtime_ns, key]
+        return key
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def get(self, key):
+        """Return the cached float16 probability row for `key`, or None."""
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        if self.probs is None or row >= self.probs.shape[0]:
+            self.probs_file.flush()
+            self.probs = np.memmap(self.probs_path, dtype=np.float16, mode="r").reshape(-1, self.num_labels)
+        return self.probs[row]
+
+    def add(self, key, probs):
+        """Append a probability row for `key`."""
+        if key in self.rows:
+            return
+        probs = np.ascontiguousarray(probs, dtype=np.float16)
+        if self.num_labels is None:
+            self.num_labels = probs.shape[0]
+        elif probs.shape[0] != self.num_labels:
+            raise ValueError(f"Expected {self.num_labels} probabilities, got {probs.shape[0]}")
+        self.probs_file.write(probs.tobytes())
+        with self.lock:
+            self.rows[key] = self.new_rows[key] = len(self.rows)
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every:
+            self.flush()
+
+    def has_labels(self):
+        return os.path.exists(self.labels_path)
+
+    def save_labels(self, tag_names, rating_indexes, general_indexes, character_indexes):
+        save_labels(self.labels_path, tag_names, rating_indexes, general_indexes, character_indexes)
+
+    def load_labels(self):
+        return read_labels(self.labels_path)
+
+    def flush(self):
+        """
+        Make all appended rows durable, then publish them (and new file hashes) as
+        one journal line. Only the entries added since the last flush are written,
+        so a long run does not rewrite the whole index every flush_every rows.
+        """
+        self.probs_file.flush()
+        os.fsync(self.probs_file.fileno())
+        with self.lock:
+            new_rows, self.new_rows = self.new_rows, {}
+            new_files, self.new_files = self.new_files, {}
+        if new_rows or new_files:
+            self.journal_file.write(json.dumps({"num_labels": self.num_labels, "rows": new_rows, "files": new_files}) + "\n")
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+        self.unflushed = 0
+
+    def close(self):
+        """Flush, then fold the journal into the full index once."""
+        self.flush()
+        self.probs_file.close()
+        self.probs = None
+        with self.lock:
+            index = {"num_labels": self.num_labels, "rows": dict(self.rows), "files": dict(self.files)}
+        write_json_atomic(self.index_path, index)
+        self.journal_file.close()
+        os.remove(self.journal_path)
@@ -1,11 +1,29 @@
 import argparse
+import hashlib
+import io
+import multiprocessing
 import os
+import platform
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from queue import Empty, Queue
 import numpy as np
 import onnxruntime as rt
 import pandas as pd
+import requests
 from PIL import Image
 from tqdm import tqdm
 import huggingface_hub
+from image_io import open_image
+import tag_cache
+import tag_profile
+from tag_cache import ProbabilityCache
+from tag_manifest import TagManifest
 
 # Constants
 MODEL_FILENAME = "model.onnx"
@@ -17,6 +35,53 @@ MODEL_REPOS = {
     # Add other models here if needed
 }
 
+def resolve_model_dir(model_repo, model_dir=None):
+    """
+    Find a local directory holding both model files for `model_repo`, without
+    touching the network. Looks in `model_dir` (directly, or in a subfolder named
+    after the repo) and then in MODEL_REPOS. Returns None if nothing is found.
+    """
+    candidates = []
+    if model_dir:
+        candidates += [
+            os.path.join(model_dir, model_repo.split("/")[-1]),
+            os.path.join(model_dir, model_repo.replace("/", "--")),
+            model_dir,
+        ]
+    if model_repo in MODEL_REPOS:
+        candidates.append(MODEL_REPOS[model_repo])
+
+    for candidate in candidates:
+        if all(os.path.isfile(os.path.join(candidate, f)) for f in (MODEL_FILENAME, LABEL_FILENAME)):
+            return candidate
+    return None
+
+def hub_download(model_repo, filename):
+    """Download from the Hub, preferring an already cached copy so warm starts stay offline."""
+    try:
+        return huggingface_hub.hf_hub_download(model_repo, filename, local_files_only=True)
+    except Exception:
+        return huggingface_hub.hf_hub_download(model_repo, filename)
+
+def cached_file_path(cache_dir, source_path, suffix, host_specific=False):
+    """
+    Path in `cache_dir` for a file derived from `source_path`; changes when the
+    source changes. Host-specific files also change with the machine.
+    """
+    stat = os.stat(source_path)
+    key = f"{os.path.abspath(source_path)}:{stat.st_size}:{stat.st_mtime_ns}:{rt.__version__}"
+    if host_specific:
+        key += f":{platform.node()}:{platform.machine()}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(cache_dir, f"{name}-{digest}{suffix}")
+
+def quantized_model_path(model_path, model_cache_dir=None):
+    """Where quantize_tagger.py stores the int8 copy of `model_path`."""
+    if model_cache_dir:
+        return cached_file_path(model_cache_dir, model_path, ".int8.onnx")
+    return f"{os.path.splitext(model_path)[0]}.int8.onnx"
+
 # Load labels
 def load_labels(dataframe):
     kaomojis = [
@@ -28,29 +93,49 @@ def load_labels(dataframe):
         lambda x: x.replace("_", " ") if x not in kaomojis else x
     )
     tag_names = name_series.tolist()
-    rating_indexes = list(np.where(dataframe["category"] == 9)[0])
-    general_indexes = list(np.where(dataframe["category"] == 0)[0])
-    character_indexes = list(np.where(dataframe["category"] == 4)[0])
+    rating_indexes = np.where(dataframe["category"] == 9)[0]
+    general_indexes = np.where(dataframe["category"] == 0)[0]
+    character_indexes = np.where(dataframe["category"] == 4)[0]
     return tag_names, rating_indexes, general_indexes, character_indexes
 
-# Prepare image
-def prepare_image(image, target_size):
+# Pad and resize image
+def pad_and_resize(image, target_size):
+    """Pad the image to a white square and resize it to the model input size."""
     # Ensure image is in RGB mode if not already
     image = image.convert("RGB")
 
     image_shape = image.size
     max_dim = max(image_shape)
-    pad_left = (max_dim - image_shape[0]) // 2
-    pad_top = (max_dim - image_shape[1]) // 2
+    if image_shape[0] == image_shape[1]:
+        # Already square: padding would paste over the whole canvas
+        padded_image = image
+    else:
+        pad_left = (max_dim - image_shape[0]) // 2
+        pad_top = (max_dim - image_shape[1]) // 2
 
-    padded_image = Image.new("RGB", (max_dim, max_dim), (255, 255, 255))
-    padded_image.paste(image, (pad_left, pad_top))
+        padded_image = Image.new("RGB", (max_dim, max_dim), (255, 255, 255))
+        padded_image.paste(image, (pad_left, pad_top))
 
     if max_dim != target_size:
         padded_image = padded_image.resize(
             (target_size, target_size),
             Image.BICUBIC,
         )
+    return padded_image
+
+# Prepare image
+def prepare_image(image, target_size, out=None):
+    """
+    Pad the image to a white square, resize it and convert it to BGR float32.
+    If `out` is given, the result is written into that (target_size, target_size, 3)
+    buffer instead of allocating a new array.
+    """
+    padded_image = pad_and_resize(image, target_size)
+
+    if out is not None:
+        # Flip RGB -> BGR while casting straight into the contiguous buffer
+        np.copyto(out, np.asarray(padded_image)[:, :, ::-1], casting="unsafe")
+        return out
 
     image_array = np.asarray(padded_image, dtype=np.float32)
     image_array = image_array[:, :, ::-1]
@@ -58,72 +143,285 @@ def prepare_image(image, target_size):
 
 # Maximum Cut Thresholding (MCut)
 def mcut_threshold(probs):
-    sorted_probs = probs[probs.argsort()[::-1]]
-    difs = sorted_probs[:-1] - sorted_probs[1:]
-    t = difs.argmax()
-    thresh = (sorted_probs[t] + sorted_probs[t + 1]) / 2
-    return thresh
+    """MCut threshold of a probability vector, or of each row of a (batch, labels) matrix."""
+    sorted_probs = -np.sort(-probs, axis=-1)
+    difs = sorted_probs[..., :-1] - sorted_probs[..., 1:]
+    t = difs.argmax(axis=-1)[..., np.newaxis]
+    thresh = (
+        np.take_along_axis(sorted_probs, t, axis=-1)
+        + np.take_along_axis(sorted_probs, t + 1, axis=-1)
+    ) / 2
+    return thresh[..., 0][()]
+
+def select_tags(names, probs, mask):
+    """Build a {name: prob} dict for the labels selected by `mask`."""
+    indexes = np.flatnonzero(mask)
+    return dict(zip(names[indexes], probs[indexes].tolist()))
 
 # Predictor class
 class Predictor:
-    def __init__(self):
+    def __init__(self, cache=None, intra_op_threads=None, inter_op_threads=None, model_dir=None, model_cache_dir=None, precision="fp32"):
         self.model_target_size = None
         self.last_loaded_repo = None
+        self.labels_repo = None
+        self.input_buffer = None
+        self.cache = cache
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.model_dir = model_dir
+        self.model_cache_dir = model_cache_dir
+        self.precision = precision
+
+    def download_labels(self, model_repo):
+        local_dir = resolve_model_dir(model_repo, self.model_dir)
+        if local_dir is not None:
+            return os.path.join(local_dir, LABEL_FILENAME)
+        return hub_download(model_repo, LABEL_FILENAME)
 
     def download_model(self, model_repo):
-        csv_path = huggingface_hub.hf_hub_download(model_repo, LABEL_FILENAME)
-        model_path = huggingface_hub.hf_hub_download(model_repo, MODEL_FILENAME)
+        local_dir = resolve_model_dir(model_repo, self.model_dir)
+        if local_dir is not None:
+            return os.path.join(local_dir, LABEL_FILENAME), os.path.join(local_dir, MODEL_FILENAME)
+        csv_path = hub_download(model_repo, LABEL_FILENAME)
+        model_path = hub_download(model_repo, MODEL_FILENAME)
         return csv_path, model_path
 
-    def load_model(self, model_repo):
-        if model_repo == self.last_loaded_repo:
+    def read_labels(self, csv_path):
+        """Parse the label CSV, reusing the parsed arrays from the model cache dir if present."""
+        if not self.model_cache_dir:
+            return load_labels(pd.read_csv(csv_path))
+
+        labels_path = cached_file_path(self.model_cache_dir, csv_path, ".npz")
+        if os.path.exists(labels_path):
+            return tag_cache.read_labels(labels_path)
+        sep_tags = load_labels(pd.read_csv(csv_path))
+        os.makedirs(self.model_cache_dir, exist_ok=True)
+        tag_cache.save_labels(labels_path, *sep_tags)
+        return sep_tags
+
+    def fetch_labels(self, model_repo):
+        """Return the parsed labels of a model repo: tag names and the rating/general/character indexes."""
+        return self.read_labels(self.download_labels(model_repo))
+
+    def load_labels(self, model_repo):
+        """Load the tag labels only, from the probability cache when it has them."""
+        if model_repo == self.labels_repo:
             return
 
-        csv_path, model_path = self.download_model(model_repo)
-        tags_df = pd.read_csv(csv_path)
-        sep_tags = load_labels(tags_df)
+        if self.cache is not None and self.cache.has_labels():
+            sep_tags = self.cache.load_labels()
+        else:
+            sep_tags = self.fetch_labels(model_repo)
+            if self.cache is not None:
+                self.cache.save_labels(*sep_tags)
 
         self.tag_names = sep_tags[0]
         self.rating_indexes = sep_tags[1]
         self.general_indexes = sep_tags[2]
         self.character_indexes = sep_tags[3]
 
-        model = rt.InferenceSession(model_path)
+        tag_names = np.array(self.tag_names, dtype=object)
+        self.rating_names = tag_names[self.rating_indexes]
+        self.general_names = tag_names[self.general_indexes]
+        self.character_names = tag_names[self.character_indexes]
+
+        self.labels_repo = model_repo
+
+    def create_session(self, model_path):
+        """
+        Create the onnxruntime session. With a model cache dir, the graph optimized
+        on the first start is saved there and later starts load it with graph
+        optimizations disabled, skipping the optimization pass.
+        """
+        options = rt.SessionOptions()
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads:
+            options.inter_op_num_threads = self.inter_op_threads
+        if not self.model_cache_dir:
+            return rt.InferenceSession(model_path, sess_options=options)
+
+        # Fully optimized graphs may contain hardware-specific kernels, so they are cached per host
+        optimized_path = cached_file_path(self.model_cache_dir, model_path, ".opt.onnx", host_specific=True)
+        if os.path.exists(optimized_path):
+            options.graph_optimization_level = rt.GraphOptimizationLevel.ORT_DISABLE_ALL
+            return rt.InferenceSession(optimized_path, sess_options=options)
+
+        # Write under a per-process name so concurrent workers never see a partial file
+        os.makedirs(self.model_cache_dir, exist_ok=True)
+        tmp_path = f"{optimized_path}.{os.getpid()}.tmp"
+        options.optimized_model_filepath = tmp_path
+        model = rt.InferenceSession(model_path, sess_options=options)
+        os.replace(tmp_path, optimized_path)
+        return model
+
+    def load_model(self, model_repo):
+        if model_repo == self.last_loaded_repo:
+            return
+
+        start_time = time.perf_counter()
+        self.load_labels(model_repo)
+        _, model_path = self.download_model(model_repo)
+        if self.precision == "int8":
+            model_path = quantized_model_path(model_path, self.model_cache_dir)
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(
+                    f"No int8 model at {model_path}; create it with quantize_tagger.py "
+                    f"(with the same --model_dir/--model_cache_dir)"
+                )
+
+        model = self.create_session(model_path)
         _, height, width, _ = model.get_inputs()[0].shape
         self.model_target_size = height
+        print(f"Loaded {model_repo} ({self.precision}) in {time.perf_counter() - start_time:.2f}s")
 
         self.last_loaded_repo = model_repo
         self.model = model
+        self.input_buffer = None
+
+    def get_input_buffer(self, batch_size):
+        """Return a contiguous float32 buffer able to hold `batch_size` prepared images."""
+        if self.input_buffer is None or self.input_buffer.shape[0] < batch_size:
+            size = self.model_target_size
+            self.input_buffer = np.empty((batch_size, size, size, 3), dtype=np.float32)
+        # Slicing the leading axis keeps the view contiguous for the last partial batch
+        return self.input_buffer[:batch_size]
 
     def predict(self, image, model_repo, general_thresh, general_mcut_enabled, character_thresh, character_mcut_enabled):
+        return self.predict_batch(
+            [image],
+            model_repo,
+            general_thresh,
+            general_mcut_enabled,
+            character_thresh,
+            character_mcut_enabled
+        )[0]
+
+    def predict_batch(self, images, model_repo, general_thresh, general_mcut_enabled, character_thresh, character_mcut_enabled, keys=None):
+        """
+        Run a list of images through the model in a single session call.
+        With a probability cache and content `keys`, cached images skip the model
+        (their entry in `images` may be None) and new results are added to the cache.
+        """
+        if self.cache is not None and keys is not None:
+            preds = self.run_cached(images, model_repo, keys)
+        else:
+            preds = self.run_model(images, model_repo)
+
+        return self.process_predictions(
+            preds,
+            general_thresh,
+            general_mcut_enabled,
+            character_thresh,
+            character_mcut_enabled
+        )
+
+    def run_model(self, images, model_repo):
+        """Return the raw (batch, labels) probabilities for a list of images."""
         self.load_model(model_repo)
-        image = prepare_image(image, self.model_target_size)
+        batch = self.get_input_buffer(len(images))
+        with tag_profile.span("prepare", len(images)):
+            for i, image in enumerate(images):
+                prepare_image(image, self.model_target_size, out=batch[i])
 
         input_name = self.model.get_inputs()[0].name
         label_name = self.model.get_outputs()[0].name
-        preds = self.model.run([label_name], {input_name: image})[0]
+        with tag_profile.span("inference", len(images)):
+            return self.model.run([label_name], {input_name: batch})[0]
 
-        labels = list(zip(self.tag_names, preds[0].astype(float)))
+    def run_cached(self, images, model_repo, keys):
+        """
+        Like run_model, but reads cached rows and only runs the misses. Results are
+        rounded to the cache's float16 so fresh and cached captions are identical.
+        """
+        self.load_labels(model_repo)
+        rows = [self.cache.get(key) for key in keys]
+        misses = [i for i, row in enumerate(rows) if row is None]
+        if misses:
+            preds = self.run_model([images[i] for i in misses], model_repo)
+            for i, pred in zip(misses, preds):
+                self.cache.add(keys[i], pred)
+                rows[i] = pred.astype(np.float16)
+        return np.stack(rows)
 
-        ratings_names = [labels[i] for i in self.rating_indexes]
-        rating = dict(ratings_names)
+    def process_predictions(self, preds, general_thresh, general_mcut_enabled, character_thresh, character_mcut_enabled):
+        """Threshold a (batch, labels) prediction matrix and build the tag dicts of each row."""
+        preds = preds.astype(np.float64)
+        rating_probs = preds[:, self.rating_indexes]
+        general_probs = preds[:, self.general_indexes]
+        character_probs = preds[:, self.character_indexes]
 
-        general_names = [labels[i] for i in self.general_indexes]
         if general_mcut_enabled:
-            general_probs = np.array([x[1] for x in general_names])
             general_thresh = mcut_threshold(general_probs)
-        general_res = [x for x in general_names if x[1] > general_thresh]
-        general_res = dict(general_res)
+        general_mask = general_probs > np.reshape(general_thresh, (-1, 1))
 
-        character_names = [labels[i] for i in self.character_indexes]
         if character_mcut_enabled:
-            character_probs = np.array([x[1] for x in character_names])
             character_thresh = mcut_threshold(character_probs)
-            character_thresh = max(0.15, character_thresh)
-        character_res = [x for x in character_names if x[1] > character_thresh]
-        character_res = dict(character_res)
+            character_thresh = np.maximum(0.15, character_thresh)
+        character_mask = character_probs > np.reshape(character_thresh, (-1, 1))
+
+        results = []
+        for i in range(len(preds)):
+            rating = dict(zip(self.rating_names, rating_probs[i].tolist()))
+            general_res = select_tags(self.general_names, general_probs[i], general_mask[i])
+            character_res = select_tags(self.character_names, character_probs[i], character_mask[i])
+            results.append((rating, character_res, general_res))
+        return results
+
+class RemotePredictor(Predictor):
+    """
+    Predictor backed by a running tag_server: images are padded/resized here and
+    sent as one uint8 array per batch, so the model is never loaded in this
+    process. Labels come from the server too; thresholding stays local.
+    """
+
+    def __init__(self, server_url, cache=None, timeout=300, precision="fp32"):
+        super().__init__(cache=cache, precision=precision)
+        self.server_url = server_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def get(self, path):
+        response = self.session.get(f"{self.server_url}{path}", timeout=self.timeout)
+        response.raise_for_status()
+        return response
 
-        return rating, character_res, general_res
+    def fetch_labels(self, model_repo):
+        self.check_model(model_repo)
+        return tag_cache.read_labels(io.BytesIO(self.get("/labels").content))
+
+    def check_model(self, model_repo):
+        info = self.get("/info").json()
+        if info["model"] != model_repo:
+            raise ValueError(f"Server at {self.server_url} serves {info['model']}, not {model_repo}")
+        # Servers older than the precision field only ran fp32
+        if info.get("precision", "fp32") != self.precision:
+            raise ValueError(f"Server at {self.server_url} runs the {info.get('precision', 'fp32')} model, not {self.precision}")
+        return info
+
+    def load_model(self, model_repo):
+        if model_repo == self.last_loaded_repo:
+            return
+        self.load_labels(model_repo)
+        self.model_target_size = self.check_model(model_repo)["target_size"]
+        self.last_loaded_repo = model_repo
+
+    def run_model(self, images, model_repo):
+        self.load_model(model_repo)
+        with tag_profile.span("prepare", len(images)):
+            batch = np.stack([np.asarray(pad_and_resize(image, self.model_target_size)) for image in images])
+            body = io.BytesIO()
+            np.save(body, batch)
+        with tag_profile.span("inference", len(images)):
+            response = self.session.post(
+                f"{self.server_url}/predict",
+                data=body.getvalue(),
+                headers={"X-Model": model_repo},
+                timeout=self.timeout,
+            )
+        if response.status_code != 200:
+            raise RuntimeError(f"Tagging server error {response.status_code}: {response.text}")
+        return np.load(io.BytesIO(response.content))
 
 def format_tags(tags_dict, add_tags=None):
     """
@@ -141,28 +439,350 @@ def format_tags(tags_dict, add_tags=None):
     
     return formatted_tags
 
-def tag_images(image_folder, model_name, general_thresh, general_mcut_enabled, character_thresh, character_mcut_enabled, add_tags):
-    predictor = Predictor()
+def load_image(image_path, target_size, cache=None):
+    """
+    Decode an image and pad/resize it for the model. Runs on the decoder threads.
+    Returns (content key, image); with a cache, cached images are not decoded and
+    the image is None. The key is None without a cache.
+    """
+    key = None
+    if cache is not None:
+        with tag_profile.span("hash"):
+            key = cache.file_key(image_path)
+        if key in cache or target_size is None:
+            return key, None
+    with tag_profile.span("open"):
+        image = open_image(image_path, target_size, side="long")
+    with image:
+        with tag_profile.span("decode"):
+            rgb_image = image.convert("RGB")
+        with tag_profile.span("pad_resize"):
+            return key, pad_and_resize(rgb_image, target_size)
+
+def iter_decoded_images(image_paths, target_size, decode_workers, max_pending, cache=None):
+    """
+    Yield load_image results in input order while up to `max_pending` images are
+    decoded ahead on a thread pool. Pillow releases the GIL while decoding and
+    resizing, so threads overlap with inference. The bounded window keeps memory
+    flat regardless of the number of images.
+    """
+    if decode_workers <= 0:
+        for image_path in image_paths:
+            yield load_image(image_path, target_size, cache)
+        return
+
+    with ThreadPoolExecutor(max_workers=decode_workers) as executor:
+        pending = deque()
+        for image_path in image_paths:
+            pending.append(executor.submit(load_image, image_path, target_size, cache))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+class CaptionWriter:
+    """Writes caption files on a background thread, in submission order."""
+
+    def __init__(self, max_pending=256):
+        self.queue = Queue(maxsize=max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue
+            output_file, tags, on_written = item
+            try:
+                print(tags)
+                with tag_profile.span("write"):
+                    with open(output_file, "w") as f:
+                        f.write(f"{tags}")
+                    if on_written is not None:
+                        on_written()
+            except Exception as e:
+                self.error = e
+
+    def write(self, output_file, tags, on_written=None):
+        """Queue a caption; `on_written` is called on the writer thread once it is on disk."""
+        if self.error is not None:
+            raise self.error
+        self.queue.put((output_file, tags, on_written))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+def iter_predictions(predictor, model_name, image_paths, batch_size, decode_workers, from_cache, progress):
+    """
+    Yield (indexes into image_paths, probabilities) batches computed in this
+    process, decoding ahead of inference.
+    """
+    cache = predictor.cache
+    decoded = iter_decoded_images(
+        image_paths,
+        predictor.model_target_size,
+        decode_workers,
+        max_pending=max(2 * batch_size, 2 * decode_workers),
+        cache=cache
+    )
+
+    try:
+        for start in range(0, len(image_paths), batch_size):
+            indexes, keys, images = [], [], []
+            for index in range(start, min(start + batch_size, len(image_paths))):
+                with tag_profile.span("wait_decode"):
+                    key, image = next(decoded)
+                progress.update(1)
+                if from_cache and key not in cache:
+                    print(f"Not in cache, skipping: {image_paths[index]}")
+                    continue
+                indexes.append(index)
+                keys.append(key)
+                images.append(image)
+            if not images:
+                continue
+
+            if cache is not None:
+                yield indexes, predictor.run_cached(images, model_name, keys)
+            else:
+                yield indexes, predictor.run_model(images, model_name)
+    finally:
+        decoded.close()
+
+def run_worker(worker_id, model_name, image_paths, indexes, batch_size, decode_workers, intra_op_threads, inter_op_threads, model_dir, model_cache_dir, result_queue, profile=False, precision="fp32"):
+    """Worker process: tag one shard with its own session and send the raw probabilities back."""
+    try:
+        # A forked worker inherits the parent's profiler; start from a clean one (or none)
+        profiler = tag_profile.enable() if profile else None
+        if not profile:
+            tag_profile.disable()
+        start_time = time.perf_counter()
+        predictor = Predictor(
+            intra_op_threads=intra_op_threads,
+            inter_op_threads=inter_op_threads,
+            model_dir=model_dir,
+            model_cache_dir=model_cache_dir,
+            precision=precision
+        )
+        predictor.load_model(model_name)
+        load_time = time.perf_counter() - start_time
+
+        decoded = iter_decoded_images(
+            image_paths,
+            predictor.model_target_size,
+            decode_workers,
+            max_pending=max(2 * batch_size, 2 * decode_workers)
+        )
+        for start in range(0, len(image_paths), batch_size):
+            with tag_profile.span("wait_decode", min(batch_size, len(image_paths) - start)):
+                images = [image for _, image in islice(decoded, batch_size)]
+            preds = predictor.run_model(images, model_name)
+            result_queue.put((worker_id, indexes[start:start + len(images)], preds))
+
+        elapsed = time.perf_counter() - start_time - load_time
+        result_queue.put((worker_id, None, {
+            "worker": worker_id,
+            "images": len(image_paths),
+            "seconds": elapsed,
+            "images_per_sec": len(image_paths) / elapsed if elapsed > 0 else 0.0,
+            "intra_op_threads": intra_op_threads,
+            "inter_op_threads": inter_op_threads,
+            "profile": profiler.export() if profiler is not None else None,
+        }))
+    except Exception:
+        result_queue.put((worker_id, None, {"worker": worker_id, "error": traceback.format_exc()}))
+
+def iter_worker_predictions(predictor, model_name, image_paths, batch_size, decode_workers, workers, intra_op_threads, inter_op_threads, progress):
+    """
+    Yield (indexes into image_paths, probabilities) batches computed by `workers`
+    processes, each owning an onnxruntime session and an interleaved shard of the
+    files. Cached images are served here and only misses are sent to the workers.
+    Prints an images/sec report per worker at the end.
+    """
+    cache = predictor.cache
+    indexes = list(range(len(image_paths)))
+    if cache is not None:
+        with ThreadPoolExecutor(max_workers=max(1, decode_workers)) as executor:
+            keys = list(executor.map(cache.file_key, image_paths))
+        hits = [i for i in indexes if keys[i] in cache]
+        for start in range(0, len(hits), batch_size):
+            batch = hits[start:start + batch_size]
+            progress.update(len(batch))
+            yield batch, np.stack([cache.get(keys[i]) for i in batch])
+        indexes = [i for i in indexes if keys[i] not in cache]
+    if not indexes:
+        return
+
+    if intra_op_threads is None:
+        intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+    if inter_op_threads is None:
+        inter_op_threads = 1
+
+    result_queue = multiprocessing.Queue(maxsize=4 * workers)
+    processes = []
+    for worker_id in range(workers):
+        shard = indexes[worker_id::workers]
+        if not shard:
+            continue
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(
+                worker_id,
+                model_name,
+                [image_paths[i] for i in shard],
+                shard,
+                batch_size,
+                decode_workers,
+                intra_op_threads,
+                inter_op_threads,
+                predictor.model_dir,
+                predictor.model_cache_dir,
+                result_queue,
+                tag_profile.current() is not None,
+                predictor.precision,
+            ),
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+
+    reports = []
+    try:
+        while len(reports) < len(processes):
+            try:
+                with tag_profile.span("wait_workers", 0):
+                    worker_id, batch, payload = result_queue.get(timeout=1)
+            except Empty:
+                if any(p.exitcode not in (None, 0) for p in processes):
+                    raise RuntimeError("A tagging worker exited unexpectedly")
+                continue
+            if batch is None:
+                if "error" in payload:
+                    raise RuntimeError(f"Tagging worker {worker_id} failed:\n{payload['error']}")
+                if payload["profile"] is not None:
+                    tag_profile.current().merge(payload["profile"])
+                reports.append(payload)
+                continue
+
+            preds = payload
+            if cache is not None:
+                for i, pred in zip(batch, preds):
+                    cache.add(keys[i], pred)
+                preds = preds.astype(np.float16)
+            progress.update(len(batch))
+            yield batch, preds
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+    for report in sorted(reports, key=lambda r: r["worker"]):
+        print(
+            f"Worker {report['worker']}: {report['images']} images in {report['seconds']:.1f}s "
+            f"({report['images_per_sec']:.2f} images/sec, intra_op_threads={report['intra_op_threads']}, "
+            f"inter_op_threads={report['inter_op_threads']})"
+        )
+    total_rate = sum(report["images_per_sec"] for report in reports)
+    print(f"Total: {total_rate:.2f} images/sec across {len(reports)} workers")
+
+def tag_images(image_folder, model_name, general_thresh, general_mcut_enabled, character_thresh, character_mcut_enabled, add_tags, batch_size=1, decode_workers=4, cache_dir=None, from_cache=False, force=False, workers=1, intra_op_threads=None, inter_op_threads=None, model_dir=None, model_cache_dir=None, profile=False, trace_file="tag_images_trace.json", server=None, precision="fp32"):
+    profiler = tag_profile.enable() if profile else None
+    # Quantized outputs differ slightly, so they are cached and tracked apart from fp32 ones
+    cache_name = model_name if precision == "fp32" else f"{model_name}-{precision}"
+    cache = ProbabilityCache(cache_dir, cache_name) if cache_dir else None
+    if from_cache and cache is None:
+        raise ValueError("from_cache requires a cache_dir")
+
+    if server:
+        # The server batches requests itself; local worker processes would add nothing
+        predictor = RemotePredictor(server, cache=cache, precision=precision)
+        workers = 1
+    else:
+        predictor = Predictor(
+            cache=cache,
+            intra_op_threads=intra_op_threads,
+            inter_op_threads=inter_op_threads,
+            model_dir=model_dir,
+            model_cache_dir=model_cache_dir,
+            precision=precision
+        )
+    if from_cache or workers > 1:
+        # Captions are built from stored or worker-computed probabilities; the model is not loaded here
+        predictor.load_labels(model_name)
+    else:
+        predictor.load_model(model_name)
     image_files = [f for f in os.listdir(image_folder) if f.endswith(('jpg', 'jpeg', 'png'))]
 
-    for image_file in tqdm(image_files, desc="Tagging images"):
-        image_path = os.path.join(image_folder, image_file)
-        image = Image.open(image_path).convert("RGB")
-        rating, character_res, general_res = predictor.predict(
-            image,
-            model_name,
-            general_thresh,
-            general_mcut_enabled,
-            character_thresh,
-            character_mcut_enabled
+    # Skip images already tagged with the same settings, unless forced
+    settings = {
+        "model": model_name,
+        "general_thresh": general_thresh,
+        "general_mcut_enabled": general_mcut_enabled,
+        "character_thresh": character_thresh,
+        "character_mcut_enabled": character_mcut_enabled,
+        "add_tags": add_tags,
+    }
+    if precision != "fp32":
+        # Only recorded when set, so existing fp32 manifests stay valid
+        settings["precision"] = precision
+    manifest = TagManifest(image_folder, settings)
+    stats = {f: os.stat(os.path.join(image_folder, f)) for f in image_files}
+    if not force:
+        skipped = len(image_files)
+        image_files = [f for f in image_files if not manifest.is_current(f, stats[f])]
+        skipped -= len(image_files)
+        if skipped:
+            print(f"Skipping {skipped} images already tagged with these settings")
+    image_paths = [os.path.join(image_folder, image_file) for image_file in image_files]
+
+    progress = tqdm(total=len(image_files), desc="Tagging images")
+    if workers > 1 and not from_cache:
+        batches = iter_worker_predictions(
+            predictor, model_name, image_paths, batch_size, decode_workers,
+            workers, intra_op_threads, inter_op_threads, progress
         )
-        
-        tags = format_tags(general_res, add_tags)
-        print(tags)
-        
-        output_file = os.path.join(image_folder, f"{os.path.splitext(image_file)[0]}.txt")
-        with open(output_file, "w") as f:
-            f.write(f"{tags}")
+    else:
+        batches = iter_predictions(
+            predictor, model_name, image_paths, batch_size, decode_workers, from_cache, progress
+        )
+    writer = CaptionWriter()
+
+    try:
+        for indexes, preds in batches:
+            with tag_profile.span("postprocess", len(indexes)):
+                results = predictor.process_predictions(
+                    preds,
+                    general_thresh,
+                    general_mcut_enabled,
+                    character_thresh,
+                    character_mcut_enabled
+                )
+                captions = [format_tags(general_res, add_tags) for _, _, general_res in results]
+
+            for index, tags in zip(indexes, captions):
+                image_file = image_files[index]
+                output_file = os.path.join(image_folder, f"{os.path.splitext(image_file)[0]}.txt")
+                writer.write(output_file, tags, partial(manifest.record, image_file, stats[image_file]))
+    finally:
+        batches.close()
+        progress.close()
+        writer.close()
+        manifest.close()
+        if cache is not None:
+            cache.close()
+        if profiler is not None:
+            tag_profile.disable()
+            print("\n".join(profiler.summary()))
+            profiler.save_trace(trace_file)
+            print(f"Saved trace to {trace_file} (open in chrome://tracing or ui.perfetto.dev)")
 
 def main():
     parser = argparse.ArgumentParser()
@@ -173,6 +793,20 @@ def main():
     parser.add_argument("--character_thresh", type=float, default=0.85, help="Threshold for character tags")
     parser.add_argument("--character_mcut_enabled", action="store_true", help="Use MCut threshold for character tags")
     parser.add_argument("--add_tags", nargs="+", help="List of tags to prepend to each image's tags")
+    parser.add_argument("--batch_size", type=int, default=1, help="Number of images per inference call")
+    parser.add_argument("--decode_workers", type=int, default=4, help="Threads decoding images ahead of inference (0 decodes serially)")
+    parser.add_argument("--cache_dir", help="Directory of the probability cache; stores model outputs for re-thresholding")
+    parser.add_argument("--from_cache", action="store_true", help="Rebuild captions from --cache_dir without loading the model")
+    parser.add_argument("--force", action="store_true", help="Re-tag images even if the manifest says they are up to date")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes, each with its own onnxruntime session")
+    parser.add_argument("--intra_op_threads", type=int, help="onnxruntime intra-op threads per session (default: cores / workers when --workers > 1)")
+    parser.add_argument("--inter_op_threads", type=int, help="onnxruntime inter-op threads per session (default: 1 when --workers > 1)")
+    parser.add_argument("--model_dir", help="Local directory with model.onnx and selected_tags.csv (no network access)")
+    parser.add_argument("--model_cache_dir", help="Directory for the optimized ONNX graph and parsed labels, reused on later starts")
+    parser.add_argument("--profile", action="store_true", help="Time each stage per image, print percentiles at exit and save a trace")
+    parser.add_argument("--trace_file", default="tag_images_trace.json", help="Chrome trace JSON written with --profile")
+    parser.add_argument("--precision", choices=["fp32", "int8"], default="fp32", help="Run the fp32 model or its int8 copy made by quantize_tagger.py")
+    parser.add_argument("--server", help="URL of a running tag_server.py (e.g. http://127.0.0.1:8765) to use instead of loading the model")
     args = parser.parse_args()
 
     tag_images(
@@ -182,7 +816,21 @@ def main():
         args.general_mcut_enabled,
         args.character_thresh,
         args.character_mcut_enabled,
-        args.add_tags
+        args.add_tags,
+        args.batch_size,
+        args.decode_workers,
+        args.cache_dir,
+        args.from_cache,
+        args.force,
+        args.workers,
+        args.intra_op_threads,
+        args.inter_op_threads,
+        args.model_dir,
+        args.model_cache_dir,
+        args.profile,
+        args.trace_file,
+        args.server,
+        args.precision
     )
 
 if __name__ == "__main__":
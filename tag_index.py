@@ -0,0 +1,313 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from image_index import scan_files
+
+INDEX_FILENAME = ".tag_index.npz"
+CATEGORIES = ("rating", "general", "character")
+
+def parse_caption(text):
+    """The tags of a comma-separated caption, in order, without blanks or repeats."""
+    return list(dict.fromkeys(tag.strip() for tag in text.split(",") if tag.strip()))
+
+def read_caption(path):
+    with open(path, encoding="utf-8") as f:
+        return parse_caption(f.read())
+
+def write_caption(path, tags):
+    """Replace a caption file through a temp file, so it is never left half written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(", ".join(tags))
+    os.replace(tmp_path, path)
+
+def encode_strings(strings):
+    """Pack strings into one uint8 array; far smaller in an npz than a fixed-width unicode array."""
+    return np.frombuffer("\n".join(strings).encode(), dtype=np.uint8)
+
+def decode_strings(array):
+    return array.tobytes().decode().split("\n") if len(array) else []
+
+def category_tags(labels_path, category):
+    """
+    Names of the tags in a tagger category, from a model's selected_tags.csv or a
+    labels.npz of the tag cache (names already in caption form, with spaces).
+    """
+    if labels_path.endswith(".csv"):
+        import pandas as pd
+        from tag_images import load_labels
+        tag_names, rating_indexes, general_indexes, character_indexes = load_labels(pd.read_csv(labels_path))
+    else:
+        import tag_cache
+        tag_names, rating_indexes, general_indexes, character_indexes = tag_cache.read_labels(labels_path)
+    indexes = {"rating": rating_indexes, "general": general_indexes, "character": character_indexes}[category]
+    return [tag_names[i] for i in indexes]
+
+class TagIndex:
+    """
+    Columnar index of the caption .txt files below a root directory, stored in the
+    root as .tag_index.npz: a tag vocabulary and a sparse caption x tag matrix,
+    kept both by caption (CSR: indptr, indices) and by tag (tag_indptr, tag_rows),
+    so frequencies and tag filters are array operations over the whole dataset.
+    update() re-parses only new or changed captions (by size and mtime).
+    """
+
+    def __init__(self, directory, index_path=None):
+        self.directory = directory
+        self.index_path = index_path or os.path.join(directory, INDEX_FILENAME)
+        if os.path.exists(self.index_path):
+            with np.load(self.index_path) as index:
+                self.vocab = decode_strings(index["vocab"])
+                self.paths = decode_strings(index["paths"])
+                self.sizes = index["sizes"]
+                self.mtimes = index["mtimes"]
+                self.indptr = index["indptr"]
+                self.indices = index["indices"]
+                self.tag_indptr = index["tag_indptr"]
+                self.tag_rows = index["tag_rows"]
+        else:
+            self.vocab = []
+            self.paths = []
+            self.sizes = np.zeros(0, dtype=np.int64)
+            self.mtimes = np.zeros(0, dtype=np.int64)
+            self.indptr = np.zeros(1, dtype=np.int64)
+            self.indices = np.zeros(0, dtype=np.int32)
+            self.tag_indptr = np.zeros(1, dtype=np.int64)
+            self.tag_rows = np.zeros(0, dtype=np.int32)
+        self.tag_ids = {tag: i for i, tag in enumerate(self.vocab)}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def save(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                vocab=encode_strings(self.vocab),
+                paths=encode_strings(self.paths),
+                sizes=self.sizes,
+                mtimes=self.mtimes,
+                indptr=self.indptr,
+                indices=self.indices,
+                tag_indptr=self.tag_indptr,
+                tag_rows=self.tag_rows,
+            )
+        os.replace(tmp_path, self.index_path)
+
+    def update(self):
+        """Bring the index up to date with the caption files and save it. Returns (scanned, updated, removed)."""
+        rows = {path: row for row, path in enumerate(self.paths)}
+        keep = np.zeros(len(self.paths), dtype=bool)
+        changed = []
+        for relative_path, size, mtime_ns in scan_files(self.directory, ('.txt',)):
+            row = rows.get(relative_path)
+            if row is not None and self.sizes[row] == size and self.mtimes[row] == mtime_ns:
+                keep[row] = True
+            else:
+                changed.append((relative_path, size, mtime_ns))
+
+        removed = len(self.paths) - int(keep.sum()) - sum(relative_path in rows for relative_path, _, _ in changed)
+        if changed or not keep.all():
+            self.replace_rows(keep, changed)
+            self.save()
+        return int(keep.sum()) + len(changed), len(changed), removed
+
+    def replace_rows(self, keep, changed):
+        """Keep the rows where `keep` is set and append (relative path, size, mtime_ns) captions read from disk."""
+        new_tags = []
+        for relative_path, _, _ in changed:
+            try:
+                new_tags.append(read_caption(os.path.join(self.directory, relative_path)))
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"Error reading caption {relative_path}: {e}", file=sys.stderr)
+                new_tags.append([])
+
+        for tags in new_tags:
+            for tag in tags:
+                if tag not in self.tag_ids:
+                    self.tag_ids[tag] = len(self.vocab)
+                    self.vocab.append(tag)
+
+        lengths = np.diff(self.indptr)
+        new_lengths = np.array([len(tags) for tags in new_tags], dtype=np.int64)
+        new_indices = np.fromiter(
+            (self.tag_ids[tag] for tags in new_tags for tag in tags), dtype=np.int32, count=int(new_lengths.sum())
+        )
+        indices = np.concatenate([self.indices[np.repeat(keep, lengths)], new_indices])
+        lengths = np.concatenate([lengths[keep], new_lengths])
+
+        # Drop tags no caption uses any more, renumbering the rest
+        counts = np.bincount(indices, minlength=len(self.vocab))
+        used = counts > 0
+        renumber = (np.cumsum(used) - 1).astype(np.int32)
+        self.vocab = [tag for tag, is_used in zip(self.vocab, used) if is_used]
+        self.tag_ids = {tag: i for i, tag in enumerate(self.vocab)}
+        indices = renumber[indices]
+
+        self.paths = [path for path, is_kept in zip(self.paths, keep) if is_kept] + [path for path, _, _ in changed]
+        self.sizes = np.concatenate([self.sizes[keep], np.array([size for _, size, _ in changed], dtype=np.int64)])
+        self.mtimes = np.concatenate([self.mtimes[keep], np.array([mtime for _, _, mtime in changed], dtype=np.int64)])
+        self.indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.indices = indices
+
+        # Transpose to per-tag row lists; a stable sort keeps each list in row order
+        entry_rows = np.repeat(np.arange(len(self.paths), dtype=np.int32), lengths)
+        self.tag_rows = entry_rows[np.argsort(indices, kind="stable")]
+        self.tag_indptr = np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64)
+
+    def rows_with(self, tag):
+        """Rows whose caption has `tag`, in order."""
+        tag_id = self.tag_ids.get(tag)
+        if tag_id is None:
+            return self.tag_rows[:0]
+        return self.tag_rows[self.tag_indptr[tag_id]:self.tag_indptr[tag_id + 1]]
+
+    def mask_any(self, tags):
+        mask = np.zeros(len(self.paths), dtype=bool)
+        for tag in tags:
+            mask[self.rows_with(tag)] = True
+        return mask
+
+    def select(self, all_tags=(), any_groups=(), none_tags=()):
+        """
+        Boolean mask of the captions that have every tag of `all_tags`, at least
+        one tag of each list in `any_groups`, and no tag of `none_tags`.
+        """
+        mask = np.ones(len(self.paths), dtype=bool)
+        for tag in all_tags:
+            mask &= self.mask_any([tag])
+        for tags in any_groups:
+            mask &= self.mask_any(tags)
+        if none_tags:
+            mask &= ~self.mask_any(none_tags)
+        return mask
+
+    def frequencies(self, mask=None):
+        """(tag, count) pairs, most frequent first, over all captions or those in `mask`."""
+        if mask is None:
+            counts = np.diff(self.tag_indptr)
+        else:
+            counts = np.bincount(self.indices[np.repeat(mask, np.diff(self.indptr))], minlength=len(self.vocab))
+        order = np.argsort(-counts, kind="stable")
+        return [(self.vocab[i], int(counts[i])) for i in order if counts[i]]
+
+    def tags(self, row):
+        return [self.vocab[i] for i in self.indices[self.indptr[row]:self.indptr[row + 1]]]
+
+    def caption_paths(self, mask):
+        """Absolute caption paths of the rows in `mask`, sorted."""
+        return sorted(os.path.join(self.directory, self.paths[row]) for row in np.flatnonzero(mask))
+
+    def edit(self, mask, add_tags=(), remove_tags=(), dry_run=False):
+        """
+        Remove `remove_tags` from and prepend missing `add_tags` to every caption in
+        `mask` (added tags go first, like tag_images --add_tags), rewriting only the
+        files that change, then refresh their rows. Returns the number of files changed.
+        """
+        remove_tags = set(remove_tags)
+        changed = []
+        count = 0
+        for row in np.flatnonzero(mask):
+            relative_path = self.paths[row]
+            path = os.path.join(self.directory, relative_path)
+            tags = read_caption(path)
+            new_tags = [tag for tag in add_tags if tag not in tags] + [tag for tag in tags if tag not in remove_tags]
+            if new_tags == tags:
+                continue
+            count += 1
+            if dry_run:
+                print(f"Would rewrite {path}: {', '.join(new_tags)}")
+                continue
+            write_caption(path, new_tags)
+            stat = os.stat(path)
+            changed.append((row, (relative_path, stat.st_size, stat.st_mtime_ns)))
+
+        if changed:
+            keep = np.ones(len(self.paths), dtype=bool)
+            keep[[row for row, _ in changed]] = False
+            self.replace_rows(keep, [entry for _, entry in changed])
+            self.save()
+        return count
+
+def open_index(directory, update=True):
+    """Open the tag index of `directory`, refreshing it unless update=False."""
+    index = TagIndex(directory)
+    if update:
+        scanned, updated, removed = index.update()
+        print(f"Indexed {scanned} captions ({updated} updated, {removed} removed)", file=sys.stderr)
+    return index
+
+def add_filter_arguments(parser):
+    parser.add_argument("directory", help="Folder with the caption .txt files (searched recursively)")
+    parser.add_argument("--all", nargs="+", default=[], help="Only captions with all of these tags")
+    parser.add_argument("--any", nargs="+", default=[], help="Only captions with at least one of these tags")
+    parser.add_argument("--none", nargs="+", default=[], help="Only captions with none of these tags")
+    parser.add_argument("--has_category", choices=CATEGORIES, help="Only captions with a tag of this category (needs --labels)")
+    parser.add_argument("--lacks_category", choices=CATEGORIES, help="Only captions without a tag of this category (needs --labels)")
+    parser.add_argument("--labels", help="selected_tags.csv of the tagger model, or a labels.npz from its tag cache")
+    parser.add_argument("--no_update", action="store_true", help="Query the saved index without rescanning the captions")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Index caption files and query or edit their tags.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update_parser = subparsers.add_parser("update", help="Build or refresh the index")
+    update_parser.add_argument("directory", help="Folder with the caption .txt files (searched recursively)")
+    freq_parser = subparsers.add_parser("freq", help="Print how many captions have each tag")
+    add_filter_arguments(freq_parser)
+    freq_parser.add_argument("--top", type=int, default=50, help="Number of tags to print (0 for all)")
+    query_parser = subparsers.add_parser("query", help="List the caption files matching the filters")
+    add_filter_arguments(query_parser)
+    query_parser.add_argument("--count", action="store_true", help="Only print the number of matches")
+    edit_parser = subparsers.add_parser("edit", help="Add or remove tags in the caption files matching the filters")
+    add_filter_arguments(edit_parser)
+    edit_parser.add_argument("--add", nargs="+", default=[], help="Tags to prepend where missing")
+    edit_parser.add_argument("--remove", nargs="+", default=[], help="Tags to remove")
+    edit_parser.add_argument("--dry_run", action="store_true", help="Only print the captions that would change")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print("The specified directory does not exist.")
+        sys.exit(1)
+
+    if args.command == "update":
+        open_index(args.directory)
+        sys.exit(0)
+
+    any_groups = [args.any] if args.any else []
+    none_tags = list(args.none)
+    if args.has_category or args.lacks_category:
+        if not args.labels:
+            print("Error: --has_category and --lacks_category need --labels.")
+            sys.exit(1)
+        if args.has_category:
+            any_groups.append(category_tags(args.labels, args.has_category))
+        if args.lacks_category:
+            none_tags += category_tags(args.labels, args.lacks_category)
+
+    index = open_index(args.directory, update=not args.no_update)
+    start_time = time.perf_counter()
+    mask = index.select(args.all, any_groups, none_tags)
+    filtered = bool(args.all or any_groups or none_tags)
+
+    if args.command == "freq":
+        frequencies = index.frequencies(mask if filtered else None)
+        matches = int(mask.sum())
+        print(f"{matches} of {len(index)} captions, {len(frequencies)} tags ({(time.perf_counter() - start_time) * 1000:.1f} ms)")
+        for tag, count in frequencies[:args.top or None]:
+            print(f"{count:>9} {100 * count / max(matches, 1):6.2f}%  {tag}")
+    elif args.command == "query":
+        if args.count:
+            print(int(mask.sum()))
+        else:
+            for path in index.caption_paths(mask):
+                print(path)
+        print(f"{int(mask.sum())} of {len(index)} captions match ({(time.perf_counter() - start_time) * 1000:.1f} ms)", file=sys.stderr)
+    else:
+        if not args.add and not args.remove:
+            print("Error: give --add and/or --remove.")
+            sys.exit(1)
+        changed = index.edit(mask, args.add, args.remove, args.dry_run)
+        print(f"{'Would rewrite' if args.dry_run else 'Rewrote'} {changed} of {int(mask.sum())} matching captions")
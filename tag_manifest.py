@@ -0,0 +1,85 @@
+import json
+import os
+
+MANIFEST_FILENAME = ".tag_manifest.jsonl"
+
+class TagManifest:
+    """
+    Record of the images already tagged in a folder.
+
+    Every caption that reaches disk is followed by one appended JSON line with
+    the image's file name, size, mtime and the tagging settings. A killed run
+    loses at most the line being written, which is ignored on the next load, so
+    reruns resume after the last committed image. Later lines win, and the file
+    is compacted to one line per image when the run closes cleanly.
+    """
+
+    def __init__(self, image_folder, settings, fsync_every=100):
+        self.path = os.path.join(image_folder, MANIFEST_FILENAME)
+        self.image_folder = image_folder
+        self.settings = settings
+        self.fsync_every = fsync_every
+        self.unsynced = 0
+        self.entries = self.read_entries(self.path)
+        self.file = open(self.path, "a")
+        if self.file.tell() > 0:
+            # Terminate a torn last line so the next entry starts on its own line
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+
+    @staticmethod
+    def read_entries(path):
+        entries = {}
+        if not os.path.exists(path):
+            return entries
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write from an interrupted run
+                    continue
+                entries[entry["file"]] = entry
+        return entries
+
+    def is_current(self, image_file, stat):
+        """True if `image_file` was tagged with the current settings and has not changed since."""
+        entry = self.entries.get(image_file)
+        if entry is None:
+            return False
+        caption_file = os.path.join(self.image_folder, f"{os.path.splitext(image_file)[0]}.txt")
+        return (
+            entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["settings"] == self.settings
+            and os.path.exists(caption_file)
+        )
+
+    def record(self, image_file, stat):
+        """Commit `image_file` as tagged. Call only after its caption has been written."""
+        entry = {
+            "file": image_file,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "settings": self.settings,
+        }
+        self.entries[image_file] = entry
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every:
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+
+    def close(self):
+        """Rewrite the manifest with one line per image, atomically."""
+        self.file.close()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,112 @@
+import os
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+_NULL_SPAN = nullcontext()
+_profiler = None
+
+class Profiler:
+    """
+    Collects timed spans per stage, thread and process. Recording a span is one
+    perf_counter_ns pair and a list append, so it can stay on around every image.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.start_ns = time.perf_counter_ns()
+        # (stage, pid, thread id, start ns, duration ns, images)
+        self.events = []
+        # (pid, thread id) -> thread name
+        self.thread_names = {}
+
+    @contextmanager
+    def span(self, stage, images=1):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            key = (self.pid, threading.get_ident())
+            if key not in self.thread_names:
+                self.thread_names[key] = threading.current_thread().name
+            self.events.append((stage, self.pid, key[1], start, duration, images))
+
+    def export(self):
+        """Events and thread names in a picklable form, to send from a worker process."""
+        return {"events": self.events, "thread_names": list(self.thread_names.items())}
+
+    def merge(self, exported):
+        """Add the spans recorded by a worker process."""
+        self.events.extend(exported["events"])
+        self.thread_names.update(exported["thread_names"])
+
+    def summary(self):
+        """Per-stage call counts, totals and latency percentiles, as printable lines."""
+        wall = (time.perf_counter_ns() - self.start_ns) / 1e9
+        durations = {}
+        images = {}
+        for stage, _, _, _, duration, count in self.events:
+            durations.setdefault(stage, []).append(duration)
+            images[stage] = images.get(stage, 0) + count
+
+        lines = [f"Profile over {wall:.2f}s wall time (times in ms)"]
+        lines.append(f"{'stage':<14}{'calls':>8}{'images':>8}{'total s':>10}{'per image':>11}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+        for stage, stage_durations in durations.items():
+            ms = np.array(stage_durations) / 1e6
+            p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+            lines.append(
+                f"{stage:<14}{len(ms):>8}{images[stage]:>8}{ms.sum() / 1e3:>10.2f}"
+                f"{ms.sum() / max(images[stage], 1):>11.2f}{p50:>9.2f}{p90:>9.2f}{p99:>9.2f}{ms.max():>9.2f}"
+            )
+
+        # Share of the wall time each thread spent working (spans other than wait_*)
+        busy = {}
+        for stage, pid, thread_id, _, duration, _ in self.events:
+            if stage.startswith("wait_"):
+                continue
+            busy[(pid, thread_id)] = busy.get((pid, thread_id), 0) + duration
+        for key, duration in sorted(busy.items(), key=lambda item: -item[1]):
+            lines.append(f"  {self.thread_names.get(key, key[1])} (pid {key[0]}): busy {100 * duration / 1e9 / wall:.0f}%")
+        return lines
+
+    def save_trace(self, path):
+        """Write the spans as Chrome trace JSON, viewable in chrome://tracing or Perfetto."""
+        trace_events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": name}}
+            for (pid, thread_id), name in self.thread_names.items()
+        ]
+        for stage, pid, thread_id, start, duration, images in self.events:
+            trace_events.append({
+                "name": stage,
+                "ph": "X",
+                "ts": (start - self.start_ns) / 1e3,
+                "dur": duration / 1e3,
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"images": images},
+            })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+def enable():
+    """Start recording spans in this process, discarding any earlier ones. Returns the profiler."""
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+def disable():
+    global _profiler
+    _profiler = None
+
+def current():
+    """The active profiler, or None when profiling is off."""
+    return _profiler
+
+def span(stage, images=1):
+    """Time a block as one `stage` call covering `images` images; a no-op when profiling is off."""
+    if _profiler is None:
+        return _NULL_SPAN
+    return _profiler.span(stage, images)
@@ -0,0 +1,251 @@
+import io
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+import numpy as np
+import requests
+from PIL import Image
+import tag_cache
+from tag_images import Predictor, format_tags, load_image
+
+DEFAULT_PORT = 8765
+
+class Batcher:
+    """
+    Runs the model on one thread, merging the requests that arrive within
+    `batch_window` seconds of each other into batches of up to `max_batch_size`
+    images. Handler threads call predict() and block until their rows are ready.
+    """
+
+    def __init__(self, predictor, model_repo, max_batch_size=16, batch_window=0.01):
+        self.predictor = predictor
+        self.model_repo = model_repo
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.queue = Queue()
+        self.batches = 0
+        self.images = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def predict(self, images):
+        """Return the (len(images), labels) probabilities for a list of PIL images."""
+        future = Future()
+        self.queue.put((images, future))
+        return future.result()
+
+    def collect(self):
+        """Wait for a request, then gather more until the batch is full or the window closes."""
+        pending = [self.queue.get()]
+        count = len(pending[0][0])
+        deadline = time.monotonic() + self.batch_window
+        while count < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                pending.append(self.queue.get(timeout=timeout))
+            except Empty:
+                break
+            count += len(pending[-1][0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self.collect()
+            images = [image for request_images, _ in pending for image in request_images]
+            try:
+                preds = np.concatenate([
+                    self.predictor.run_model(images[start:start + self.max_batch_size], self.model_repo)
+                    for start in range(0, len(images), self.max_batch_size)
+                ])
+                self.batches += 1
+                self.images += len(images)
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_images, future in pending:
+                future.set_result(preds[offset:offset + len(request_images)])
+                offset += len(request_images)
+
+class TagRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /info     model name, precision, input size and batching counters (JSON)
+    GET  /labels   label arrays (npz, as tag_cache.save_labels writes them)
+    POST /predict  uint8 (N, size, size, 3) npy body -> float32 (N, labels) npy
+    POST /tag      {"paths": [...], thresholds...} -> tags and captions per path (JSON)
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200):
+        self.send_body(status, json.dumps(data).encode(), "application/json")
+
+    def send_array(self, array):
+        body = io.BytesIO()
+        np.save(body, array)
+        self.send_body(200, body.getvalue(), "application/octet-stream")
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        server = self.server
+        if self.path == "/info":
+            self.send_json({
+                "model": server.model_repo,
+                "target_size": server.predictor.model_target_size,
+                "precision": server.predictor.precision,
+                "batches": server.batcher.batches,
+                "images": server.batcher.images,
+            })
+        elif self.path == "/labels":
+            self.send_body(200, server.labels, "application/octet-stream")
+        else:
+            self.send_json({"error": f"Unknown path {self.path}"}, 404)
+
+    def do_POST(self):
+        try:
+            if self.path == "/predict":
+                self.predict()
+            elif self.path == "/tag":
+                self.tag()
+            else:
+                self.send_json({"error": f"Unknown path {self.path}"}, 404)
+        except Exception as e:
+            self.send_json({"error": str(e)}, 500)
+
+    def predict(self):
+        server = self.server
+        model = self.headers.get("X-Model")
+        if model and model != server.model_repo:
+            self.send_json({"error": f"This server serves {server.model_repo}, not {model}"}, 400)
+            return
+        batch = np.load(io.BytesIO(self.read_body()))
+        size = server.predictor.model_target_size
+        if batch.dtype != np.uint8 or batch.ndim != 4 or batch.shape[1:] != (size, size, 3):
+            self.send_json({"error": f"Expected uint8 images of shape (N, {size}, {size}, 3)"}, 400)
+            return
+        self.send_array(server.batcher.predict([Image.fromarray(image) for image in batch]))
+
+    def tag(self):
+        server = self.server
+        request = json.loads(self.read_body())
+        images, results = [], []
+        for path in request["paths"]:
+            try:
+                images.append(load_image(path, server.predictor.model_target_size)[1])
+                results.append({"path": path})
+            except Exception as e:
+                results.append({"path": path, "error": str(e)})
+
+        ok = [result for result in results if "error" not in result]
+        if images:
+            preds = server.batcher.predict(images)
+            tags = server.predictor.process_predictions(
+                preds,
+                request.get("general_thresh", 0.35),
+                request.get("general_mcut_enabled", False),
+                request.get("character_thresh", 0.85),
+                request.get("character_mcut_enabled", False),
+            )
+            for result, (rating, character_res, general_res) in zip(ok, tags):
+                result["rating"] = rating
+                result["character"] = character_res
+                result["general"] = general_res
+                result["caption"] = format_tags(general_res, request.get("add_tags"))
+        self.send_json({"results": results})
+
+def make_server(model_repo, host="127.0.0.1", port=DEFAULT_PORT, max_batch_size=16, batch_window=0.01,
+                intra_op_threads=None, inter_op_threads=None, model_dir=None, model_cache_dir=None, precision="fp32"):
+    """Load the model once and return a ready ThreadingHTTPServer; call serve_forever() on it."""
+    predictor = Predictor(
+        intra_op_threads=intra_op_threads,
+        inter_op_threads=inter_op_threads,
+        model_dir=model_dir,
+        model_cache_dir=model_cache_dir,
+        precision=precision
+    )
+    predictor.load_model(model_repo)
+
+    server = ThreadingHTTPServer((host, port), TagRequestHandler)
+    server.daemon_threads = True
+    server.model_repo = model_repo
+    server.predictor = predictor
+    server.batcher = Batcher(predictor, model_repo, max_batch_size, batch_window)
+    labels = io.BytesIO()
+    tag_cache.save_labels(
+        labels,
+        predictor.tag_names,
+        predictor.rating_indexes,
+        predictor.general_indexes,
+        predictor.character_indexes
+    )
+    server.labels = labels.getvalue()
+    return server
+
+def tag_paths(paths, server_url=f"http://127.0.0.1:{DEFAULT_PORT}", **settings):
+    """
+    Tag image files with a running server, e.g. from a notebook. `settings` are
+    general_thresh, general_mcut_enabled, character_thresh, character_mcut_enabled
+    and add_tags. Returns one dict per path with "caption", "general",
+    "character" and "rating" (or "error").
+    """
+    response = requests.post(
+        f"{server_url.rstrip('/')}/tag",
+        json={"paths": [str(path) for path in paths], **settings},
+        timeout=300,
+    )
+    response.raise_for_status()
+    return response.json()["results"]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the tagger over localhost HTTP with dynamic batching.")
+    parser.add_argument("--model_name", default="SmilingWolf/wd-v1-4-swinv2-tagger-v2", help="Hugging Face model name")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--max_batch_size", type=int, default=16, help="Most images per model call")
+    parser.add_argument("--batch_window_ms", type=float, default=10, help="How long to wait for more requests to batch together")
+    parser.add_argument("--intra_op_threads", type=int, help="onnxruntime intra-op threads")
+    parser.add_argument("--inter_op_threads", type=int, help="onnxruntime inter-op threads")
+    parser.add_argument("--model_dir", help="Local directory with model.onnx and selected_tags.csv (no network access)")
+    parser.add_argument("--model_cache_dir", help="Directory for the optimized ONNX graph and parsed labels")
+    parser.add_argument("--precision", choices=["fp32", "int8"], default="fp32", help="Serve the fp32 model or its int8 copy")
+    args = parser.parse_args()
+
+    server = make_server(
+        args.model_name,
+        args.host,
+        args.port,
+        args.max_batch_size,
+        args.batch_window_ms / 1000,
+        args.intra_op_threads,
+        args.inter_op_threads,
+        args.model_dir,
+        args.model_cache_dir,
+        args.precision
+    )
+    print(f"Serving {args.model_name} on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,412 @@
+import io
+import os
+import sys
+import json
+import shutil
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from PIL import Image
+from image_io import open_image
+
+CACHE_DIRNAME = ".thumbnails"
+INDEX_FILENAME = "index.jsonl"
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+DEFAULT_SHARD_SIZE = 256 << 20
+
+def make_thumbnail(image_path, size=256, quality=85):
+    """
+    Return (JPEG bytes, (width, height) of the thumbnail, source (width, height))
+    for an image scaled to fit in size x size. Large JPEGs are decoded at a
+    reduced scale, so this costs a fraction of a full decode.
+    """
+    with open_image(image_path, size, side="long") as img:
+        source_size = img.source_size
+        img = img.convert("RGB")
+        img.thumbnail((size, size), Image.BICUBIC)
+        data = io.BytesIO()
+        img.save(data, "JPEG", quality=quality)
+        return data.getvalue(), img.size, source_size
+
+def try_make_thumbnail(image_path, size, quality):
+    """make_thumbnail for a worker process: returns (result, None) or (None, error message)."""
+    try:
+        return make_thumbnail(image_path, size, quality), None
+    except Exception as e:
+        return None, str(e)
+
+def list_images(directory):
+    """{file name: (size, mtime_ns)} of the images directly in `directory`, from one scandir."""
+    images = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                stat = entry.stat()
+                images[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return images
+
+class ThumbnailCache:
+    """
+    Persistent JPEG thumbnails of the images in one folder, kept in
+    <folder>/.thumbnails as append-only shard files of up to `shard_size` bytes
+    and an index.jsonl journal. Each thumbnail's bytes are appended to a shard
+    before its index line, so a killed run only loses thumbnails, never gets a
+    wrong one. An entry is valid while the image's size and mtime match;
+    regenerated thumbnails are appended and the old bytes are left until
+    compact(). Reads are one pread, and the bytes go to the grid as they are.
+    """
+
+    def __init__(self, directory, size=256, quality=85, shard_size=DEFAULT_SHARD_SIZE, cache_dir=None):
+        self.directory = directory
+        self.cache_dir = cache_dir or os.path.join(directory, CACHE_DIRNAME)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.size = size
+        self.quality = quality
+        self.shard_size = shard_size
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILENAME)
+        self.lock = threading.Lock()
+        self.readers = {}
+
+        self.entries = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn write from an interrupted run
+                        continue
+                    self.entries[entry["file"]] = entry
+        # Thumbnails of another size are stale
+        self.entries = {name: entry for name, entry in self.entries.items() if entry.get("max_size") == size}
+
+        shards = sorted(int(name[6:-4]) for name in os.listdir(self.cache_dir) if name.startswith("shard-") and name.endswith(".bin"))
+        self.shard = shards[-1] if shards else 0
+        self.shard_file = open(self.shard_path(self.shard), "ab")
+        self.index_file = open(self.index_path, "a")
+        if self.index_file.tell() > 0:
+            # Terminate a torn last line so the next entry starts on its own line
+            with open(self.index_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.index_file.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def shard_path(self, shard):
+        return os.path.join(self.cache_dir, f"shard-{shard:04d}.bin")
+
+    def lookup(self, name, stat):
+        """The entry of `name` if it is current for its (size, mtime_ns), else None."""
+        entry = self.entries.get(name)
+        if entry is None or entry["size"] != stat[0] or entry["mtime_ns"] != stat[1]:
+            return None
+        return entry
+
+    def read(self, entry):
+        """The JPEG bytes of an entry (None for images that could not be read)."""
+        if "error" in entry:
+            return None
+        shard = entry["shard"]
+        with self.lock:
+            if shard == self.shard:
+                self.shard_file.flush()
+            if shard not in self.readers:
+                self.readers[shard] = os.open(self.shard_path(shard), os.O_RDONLY)
+            fd = self.readers[shard]
+        return os.pread(fd, entry["length"], entry["offset"])
+
+    def add(self, name, stat, result, error=None):
+        """Store the make_thumbnail() result for `name` at (size, mtime_ns) `stat`, or the error it raised."""
+        entry = {"file": name, "size": stat[0], "mtime_ns": stat[1], "max_size": self.size}
+        with self.lock:
+            if error is not None:
+                entry["error"] = error
+            else:
+                data, thumb_size, source_size = result
+                if self.shard_file.tell() + len(data) > self.shard_size and self.shard_file.tell() > 0:
+                    self.shard_file.close()
+                    self.shard += 1
+                    self.shard_file = open(self.shard_path(self.shard), "ab")
+                entry.update({
+                    "shard": self.shard,
+                    "offset": self.shard_file.tell(),
+                    "length": len(data),
+                    "width": thumb_size[0],
+                    "height": thumb_size[1],
+                    "source_width": source_size[0],
+                    "source_height": source_size[1],
+                })
+                self.shard_file.write(data)
+                self.shard_file.flush()
+            self.index_file.write(json.dumps(entry) + "\n")
+            self.index_file.flush()
+            self.entries[name] = entry
+        return entry
+
+    def close(self):
+        with self.lock:
+            self.shard_file.close()
+            self.index_file.close()
+            for fd in self.readers.values():
+                os.close(fd)
+            self.readers = {}
+
+    def compact(self, images=None):
+        """
+        Rewrite the shards with only the current thumbnails of `images` (a
+        list_images() dict, by default the folder as it is now), dropping
+        replaced thumbnails and those of deleted files. Returns bytes freed.
+        """
+        images = list_images(self.directory) if images is None else images
+        old_shards = [name for name in os.listdir(self.cache_dir) if name.startswith("shard-")]
+        before = sum(os.path.getsize(os.path.join(self.cache_dir, name)) for name in old_shards)
+        live = [(name, entry) for name, entry in self.entries.items()
+                if name in images and self.lookup(name, images[name]) is not None]
+
+        tmp_dir = f"{self.cache_dir}.tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        with ThumbnailCache(self.directory, self.size, self.quality, self.shard_size, cache_dir=tmp_dir) as compacted:
+            for name, entry in live:
+                data = self.read(entry)
+                result = None if data is None else (
+                    data, (entry["width"], entry["height"]), (entry["source_width"], entry["source_height"])
+                )
+                compacted.add(name, (entry["size"], entry["mtime_ns"]), result, entry.get("error"))
+        self.close()
+
+        old_dir = f"{self.cache_dir}.old"
+        os.rename(self.cache_dir, old_dir)
+        os.rename(tmp_dir, self.cache_dir)
+        shutil.rmtree(old_dir)
+        self.__init__(self.directory, self.size, self.quality, self.shard_size, self.cache_dir)
+        after = sum(os.path.getsize(self.shard_path(shard)) for shard in range(self.shard + 1))
+        return before - after
+
+class ThumbnailGenerator:
+    """
+    Makes missing thumbnails on a process pool. request() submits the given
+    images right away (the page being looked at); start_background() feeds the
+    rest in small windows, so a page request never waits behind more than
+    2 * workers background jobs.
+    """
+
+    def __init__(self, cache, workers=None):
+        self.cache = cache
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def request(self, images):
+        """
+        Submit the images of a {name: (size, mtime_ns)} dict that have no current
+        thumbnail. Returns {name: future} for those being generated.
+        """
+        futures = {}
+        submitted = []
+        with self.lock:
+            for name, stat in images.items():
+                if name in self.in_flight:
+                    futures[name] = self.in_flight[name]
+                    continue
+                if self.cache.lookup(name, stat) is not None:
+                    continue
+                future = self.executor.submit(
+                    try_make_thumbnail, os.path.join(self.cache.directory, name), self.cache.size, self.cache.quality
+                )
+                self.in_flight[name] = future
+                futures[name] = future
+                submitted.append((name, stat, future))
+        # Outside the lock: a future that is already done runs store() right here
+        for name, stat, future in submitted:
+            future.add_done_callback(lambda future, name=name, stat=stat: self.store(name, stat, future))
+        return futures
+
+    def store(self, name, stat, future):
+        """
+        Save a finished thumbnail, or the error try_make_thumbnail returned for an
+        unreadable image. Cancelled jobs and pool failures (e.g. a killed worker)
+        say nothing about the image, so nothing is saved and it is retried later.
+        """
+        try:
+            if not future.cancelled() and future.exception() is None:
+                result, error = future.result()
+                self.cache.add(name, stat, result, error)
+        finally:
+            with self.lock:
+                self.in_flight.pop(name, None)
+
+    def start_background(self, images):
+        """Generate thumbnails for all of `images` on a background thread."""
+        def run():
+            pending = set()
+            for name, stat in images.items():
+                if self.stopped.is_set():
+                    return
+                pending.update(self.request({name: stat}).values())
+                if len(pending) >= 2 * self.workers:
+                    _, pending = wait(pending, return_when="FIRST_COMPLETED")
+            wait(pending)
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+class ThumbnailGrid:
+    """
+    Paginated view of a folder for the image viewer notebook. Only the visible
+    page is read from the cache (and generated first when missing); the next
+    page is prefetched and the rest of the folder is filled in the background.
+    """
+
+    def __init__(self, directory, page_size=48, size=256, workers=None, background=True):
+        self.directory = directory
+        self.page_size = page_size
+        self.cache = ThumbnailCache(directory, size)
+        self.generator = ThumbnailGenerator(self.cache, workers)
+        self.refresh()
+        if background:
+            self.generator.start_background(self.images)
+
+    def refresh(self):
+        """Re-list the folder."""
+        self.images = list_images(self.directory)
+        self.names = sorted(self.images)
+
+    @property
+    def page_count(self):
+        return max(1, -(-len(self.names) // self.page_size))
+
+    def page_images(self, page):
+        names = self.names[page * self.page_size:(page + 1) * self.page_size]
+        return {name: self.images[name] for name in names}
+
+    def page(self, page, timeout=30):
+        """
+        Return [(file name, JPEG bytes or None, source (width, height) or None)]
+        for page `page`, generating its missing thumbnails first.
+        """
+        images = self.page_images(page)
+        futures = self.generator.request(images)
+        wait(futures.values(), timeout=timeout)
+        if page + 1 < self.page_count:
+            self.generator.request(self.page_images(page + 1))
+
+        items = []
+        for name, stat in images.items():
+            future = futures.get(name)
+            if future is not None:
+                # Use the result itself: the callback adding it to the cache may not have run yet
+                if not future.done() or future.cancelled() or future.exception() is not None:
+                    items.append((name, None, None))
+                    continue
+                result, error = future.result()
+                items.append((name, None, None) if error is not None else (name, result[0], result[2]))
+                continue
+            entry = self.cache.lookup(name, stat)
+            if entry is None or "error" in entry:
+                items.append((name, None, None))
+            else:
+                items.append((name, self.cache.read(entry), (entry["source_width"], entry["source_height"])))
+        return items
+
+    def close(self):
+        self.generator.close()
+        self.cache.close()
+
+    def widget(self, columns=6, preview_size=1024):
+        """
+        An ipywidgets grid with page buttons; clicking a thumbnail shows the image
+        at up to `preview_size` pixels with its name and resolution.
+        """
+        import ipywidgets as widgets
+
+        state = {"page": 0}
+        grid = widgets.GridBox(layout=widgets.Layout(grid_template_columns=f"repeat({columns}, {self.cache.size + 8}px)"))
+        label = widgets.Label()
+        previous_button = widgets.Button(description="Previous")
+        next_button = widgets.Button(description="Next")
+        refresh_button = widgets.Button(description="Refresh")
+        preview = widgets.Image(format="jpeg")
+        preview_label = widgets.Label()
+
+        def show_preview(name, source_size):
+            with open_image(os.path.join(self.directory, name), preview_size, side="long") as img:
+                img = img.convert("RGB")
+                img.thumbnail((preview_size, preview_size), Image.LANCZOS)
+                data = io.BytesIO()
+                img.save(data, "JPEG", quality=90)
+            preview.value = data.getvalue()
+            preview_label.value = f"Name: {name}, Resolution: {source_size[0]}x{source_size[1]}"
+
+        def cell(name, data, source_size):
+            if data is None:
+                return widgets.Label(f"{name} (unreadable)")
+            button = widgets.Button(description=name, tooltip=f"{name} ({source_size[0]}x{source_size[1]})",
+                                    layout=widgets.Layout(width=f"{self.cache.size}px"))
+            button.on_click(lambda _: show_preview(name, source_size))
+            return widgets.VBox([widgets.Image(value=data, format="jpeg"), button])
+
+        def show(page):
+            state["page"] = min(max(page, 0), self.page_count - 1)
+            grid.children = [cell(*item) for item in self.page(state["page"])]
+            label.value = f"Page {state['page'] + 1} of {self.page_count} ({len(self.names)} images)"
+
+        def on_refresh(_):
+            self.refresh()
+            show(state["page"])
+
+        previous_button.on_click(lambda _: show(state["page"] - 1))
+        next_button.on_click(lambda _: show(state["page"] + 1))
+        refresh_button.on_click(on_refresh)
+        show(0)
+        return widgets.VBox([widgets.HBox([previous_button, next_button, refresh_button, label]), grid, preview_label, preview])
+
+def build(directory, size=256, workers=None):
+    """Generate every missing thumbnail of a folder, blocking. Returns the number generated."""
+    images = list_images(directory)
+    with ThumbnailCache(directory, size) as cache:
+        generator = ThumbnailGenerator(cache, workers)
+        try:
+            futures = generator.request(images)
+            wait(futures.values())
+        finally:
+            generator.close()
+        errors = sum("error" in cache.entries[name] for name in images if name in cache.entries)
+    print(f"Generated {len(futures)} thumbnails for {len(images)} images ({errors} unreadable)")
+    return len(futures)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or compact the thumbnail cache of an image folder.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Generate all missing thumbnails")
+    build_parser.add_argument("directory", help="Image folder")
+    build_parser.add_argument("--size", type=int, default=256, help="Thumbnail size (longest side)")
+    build_parser.add_argument("--workers", type=int, help="Number of processes (default: all cores)")
+    compact_parser = subparsers.add_parser("compact", help="Drop replaced thumbnails and those of deleted images")
+    compact_parser.add_argument("directory", help="Image folder")
+    compact_parser.add_argument("--size", type=int, default=256, help="Thumbnail size (longest side)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print("The specified directory does not exist.")
+        sys.exit(1)
+
+    if args.command == "build":
+        build(args.directory, args.size, args.workers)
+    else:
+        with ThumbnailCache(args.directory, args.size) as cache:
+            freed = cache.compact()
+        print(f"Freed {freed / 2**20:.1f} MiB")
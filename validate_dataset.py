@@ -0,0 +1,194 @@
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import file_ops
+from image_index import INDEX_FILENAME, ImageIndex
+from tag_cache import write_json_atomic
+
+# Extensions each format may be saved under
+FORMAT_EXTENSIONS = {
+    "JPEG": ('.jpg', '.jpeg'),
+    "PNG": ('.png',),
+    "WEBP": ('.webp',),
+    "GIF": ('.gif',),
+    "BMP": ('.bmp',),
+}
+IMAGE_EXTENSIONS = tuple(ext for extensions in FORMAT_EXTENSIONS.values() for ext in extensions)
+SIDECAR_EXTENSIONS = ('.txt',)
+DEFAULT_MODES = ("RGB", "RGBA", "L", "LA", "P")
+
+# Problems a file can have, and what can be done about them, mildest action first
+ISSUES = ("non_image", "corrupt", "format_mismatch", "bad_mode", "too_small")
+ACTIONS = ("report", "quarantine", "delete")
+
+def walk_files(directory, sidecar_extensions=SIDECAR_EXTENSIONS):
+    """
+    Yield the paths of all files below `directory` except hidden files and folders
+    (indexes, manifests, caches) and sidecar files such as captions.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file in sorted(files):
+            if not file.startswith(".") and not file.lower().endswith(sidecar_extensions):
+                yield os.path.join(root, file)
+
+def check_file(path, min_width=0, min_height=0, modes=DEFAULT_MODES, decode=True):
+    """
+    Check one file and return its record: format, size and mode when it opens,
+    and a list of issues (see ISSUES) with an error message for the first
+    failure. With decode=True the pixel data is decoded too, which is what
+    catches truncated files; JPEGs are decoded at 1/8 scale, which still reads
+    the whole stream.
+    """
+    record = {"path": path, "issues": []}
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        with Image.open(path) as img:
+            record.update(format=img.format, width=img.size[0], height=img.size[1], mode=img.mode)
+            if decode:
+                if img.format == "JPEG":
+                    img.draft(img.mode, (max(1, img.size[0] // 8), max(1, img.size[1] // 8)))
+                img.load()
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        record["issues"].append("corrupt" if "format" in record or ext in IMAGE_EXTENSIONS else "non_image")
+        return record
+
+    if ext not in FORMAT_EXTENSIONS.get(record["format"], ()):
+        record["issues"].append("format_mismatch" if ext in IMAGE_EXTENSIONS or record["format"] in FORMAT_EXTENSIONS else "non_image")
+    if record["mode"] not in modes:
+        record["issues"].append("bad_mode")
+    if record["width"] < min_width or record["height"] < min_height:
+        record["issues"].append("too_small")
+    return record
+
+def check_file_args(args):
+    return check_file(*args)
+
+def sidecars(path, sidecar_extensions=SIDECAR_EXTENSIONS):
+    """Existing sidecar files (captions) of an image, which go wherever the image goes."""
+    stem = os.path.splitext(path)[0]
+    return [f"{stem}{ext}" for ext in sidecar_extensions if os.path.exists(f"{stem}{ext}")]
+
+def validate(directory, policies=None, min_width=0, min_height=0, modes=DEFAULT_MODES, decode=True,
+             quarantine_dir=None, report_path=None, dry_run=False, workers=None, chunksize=64):
+    """
+    Check every file below `directory` in one parallel pass and apply `policies`,
+    a {issue: action} dict (issues missing from it are only reported). A file with
+    several issues gets the strongest of their actions. Quarantined files (and
+    their captions) are moved under `quarantine_dir` keeping their relative paths,
+    through file_ops, so the move can be undone from its journal. Writes a JSON
+    report to `report_path` when given and returns it.
+    """
+    policies = policies or {}
+    start_time = time.perf_counter()
+    paths = list(walk_files(directory))
+    jobs = [(path, min_width, min_height, tuple(modes), decode) for path in paths]
+    if workers == 1 or len(jobs) < chunksize:
+        records = [check_file_args(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            records = list(executor.map(check_file_args, jobs, chunksize=chunksize))
+
+    problems = [record for record in records if record["issues"]]
+    for record in problems:
+        record["action"] = max((policies.get(issue, "report") for issue in record["issues"]), key=ACTIONS.index)
+        record["path"] = os.path.relpath(record["path"], directory)
+
+    to_delete = [record["path"] for record in problems if record["action"] == "delete"]
+    to_quarantine = [record["path"] for record in problems if record["action"] == "quarantine"]
+    if to_quarantine and not quarantine_dir:
+        raise ValueError("A quarantine policy needs quarantine_dir")
+
+    if not dry_run:
+        deleted = []
+        for relative_path in to_delete:
+            path = os.path.join(directory, relative_path)
+            for file in [path] + sidecars(path):
+                try:
+                    os.remove(file)
+                except OSError as e:
+                    print(f"Error deleting {file}: {e}")
+            deleted.append(path)
+        if deleted and os.path.exists(os.path.join(directory, INDEX_FILENAME)):
+            with ImageIndex(directory) as index:
+                index.remove(deleted)
+
+        if to_quarantine:
+            os.makedirs(quarantine_dir, exist_ok=True)
+            pairs = []
+            for relative_path in to_quarantine:
+                path = os.path.join(directory, relative_path)
+                for file in [path] + sidecars(path):
+                    pairs.append((file, os.path.join(quarantine_dir, os.path.relpath(file, directory))))
+            file_ops.run(pairs, quarantine_dir)
+
+    counts = {issue: sum(issue in record["issues"] for record in problems) for issue in ISSUES}
+    report = {
+        "directory": os.path.abspath(directory),
+        "checked": len(records),
+        "settings": {
+            "min_width": min_width,
+            "min_height": min_height,
+            "modes": list(modes),
+            "decode": decode,
+            "policies": policies,
+            "quarantine_dir": quarantine_dir,
+            "dry_run": dry_run,
+        },
+        "counts": counts,
+        "actions": {action: sum(record["action"] == action for record in problems) for action in ACTIONS},
+        "seconds": round(time.perf_counter() - start_time, 3),
+        "files": problems,
+    }
+    if report_path:
+        write_json_atomic(report_path, report)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check every file of a dataset in one pass and report, quarantine or delete bad ones.")
+    parser.add_argument("directory", help="Dataset folder (searched recursively)")
+    parser.add_argument("--min_width", type=int, default=0, help="Images narrower than this are too_small")
+    parser.add_argument("--min_height", type=int, default=0, help="Images shorter than this are too_small")
+    parser.add_argument("--modes", nargs="+", default=list(DEFAULT_MODES), help="Allowed image modes; others are bad_mode")
+    parser.add_argument("--header_only", action="store_true", help="Only read headers; faster, but misses truncated files")
+    for issue in ISSUES:
+        parser.add_argument(f"--{issue}", choices=ACTIONS, default="report", help=f"What to do with {issue} files")
+    parser.add_argument("--quarantine_dir", help="Folder to move quarantined files into")
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    parser.add_argument("--dry_run", action="store_true", help="Check and report only; do not delete or move anything")
+    parser.add_argument("--workers", type=int, help="Number of checking processes (default: all cores)")
+    parser.add_argument("--verbose", action="store_true", help="Print every file with an issue")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print("The specified directory does not exist.")
+        sys.exit(1)
+    policies = {issue: getattr(args, issue) for issue in ISSUES}
+    if "quarantine" in policies.values() and not args.quarantine_dir:
+        print("Error: --quarantine_dir is required when a policy is quarantine.")
+        sys.exit(1)
+
+    report = validate(
+        args.directory,
+        policies,
+        args.min_width,
+        args.min_height,
+        args.modes,
+        not args.header_only,
+        args.quarantine_dir,
+        args.report,
+        args.dry_run,
+        args.workers
+    )
+    if args.verbose:
+        for record in report["files"]:
+            print(f"{record['action']:<10} {record['path']}: {', '.join(record['issues'])}"
+                  + (f" ({record['error']})" if "error" in record else ""))
+    issues = ", ".join(f"{count} {issue}" for issue, count in report["counts"].items() if count) or "no issues"
+    actions = ", ".join(f"{count} {action}" for action, count in report["actions"].items() if count)
+    print(f"Checked {report['checked']} files in {report['seconds']:.1f}s: {issues}"
+          + (f" ({'would ' if args.dry_run else ''}{actions})" if actions else ""))